@@ -23,7 +23,7 @@ class CodeOptimizationProcessor:
 
 def write_to_file(file_path, object):
     writer = open(file_path, 'w')
-    writer.write(str(object))
+    object.write_dump(writer)
     writer.flush()
     writer.close()
 
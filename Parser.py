@@ -1,25 +1,90 @@
-from lexer import Lexer
+from lexer import Lexer, TokenKind
 from other.SupportClasses import *
-from SemanticModule import SemanticModule
+from other.NodeArena import NodeArena
+from other.NodeFactory import NodeFactory, writable
+from SemanticModule import SemanticModule, SyntaxOnlyModule, Variable, TypeVariable
+from other.BodyWorkers import UseCountTable, BodyScopeTable, take_use_counts, dump_body_result, load_body_result
+from types import GeneratorType
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import os
+import re
+
+# TokenKind members as plain class attributes, attribute access on the Enum class
+# goes through EnumType.__getattr__ and costs several times more on every token check
+Kind = type('Kind', (), dict(TokenKind.__members__))
 
 class Parser:
+    # Binding power of binary operators, operators with a bigger one bind tighter
+    CONDITION_PRECEDENCE, EXPRESSION_PRECEDENCE, TERM_PRECEDENCE, FACTOR_PRECEDENCE = 1, 2, 3, 4
+    BINARY_PRECEDENCE = {
+        **dict.fromkeys(Operator.get_condition_operators(), CONDITION_PRECEDENCE),
+        **dict.fromkeys((Operator.PLUS, Operator.MINUS, Operator.OR, Operator.XOR), EXPRESSION_PRECEDENCE),
+        **dict.fromkeys((Operator.MULTIPLY, Operator.DIVIDE, Operator.DIV, Operator.MOD,
+                         Operator.AND, Operator.SHL, Operator.SHR), TERM_PRECEDENCE)}
+    # Tables for the parser decisions, keyed by TokenKind codes
+    BINARY_OPERATORS = {TokenKind[operator.value]: operator for operator in BINARY_PRECEDENCE}
+    BINARY_KIND_PRECEDENCE = dict(zip(BINARY_OPERATORS, map(BINARY_PRECEDENCE.get, BINARY_OPERATORS.values())))
+    UNARY_OPERATORS = {TokenKind.MINUS: Operator.MINUS, TokenKind.PLUS: Operator.PLUS, TokenKind.NOT: Operator.NOT}
+    PRIMITIVE_TYPES = {kind: PrimitiveType[kind.name] for kind in TokenKind if PrimitiveType.__contains__(kind.name)}
+    SUBROUTINE_TYPES = {TokenKind.PROCEDURE: SubroutineType.PROCEDURE, TokenKind.FUNCTION: SubroutineType.FUNCTION}
+    IDENTIFIER_SUFFIXES = frozenset((TokenKind.ASSIGN, TokenKind.LPAREN, TokenKind.LBR, TokenKind.DOT))
+    # Kinds the pre-scans of the token stream stop at, searched for in the kind codes
+    HEADER_KINDS = re.compile(b'[' + re.escape(bytes((TokenKind.LPAREN, TokenKind.RPAREN, TokenKind.SEMICOLON, TokenKind.EOF))) + b']')
+    DECLARATION_KINDS = re.compile(b'[' + re.escape(bytes((TokenKind.BEGIN, TokenKind.PROCEDURE, TokenKind.FUNCTION, TokenKind.EOF))) + b']')
+    BLOCK_KINDS = re.compile(b'[' + re.escape(bytes((TokenKind.BEGIN, TokenKind.CASE, TokenKind.END, TokenKind.EOF))) + b']')
 
-    def __init__(self, lexer : Lexer = None):
+    def __init__(self, lexer : Lexer = None, source = None, tokens = None):
+        if source is not None:
+            lexer = Lexer(source=source, engine=Lexer.ENGINE_REGEX)
+        self.lexer = None
+        self.tokens = None
+        self.current_kind = Kind.EOF
+        self.__index = 0
         if lexer:
-            self.lexer = lexer
-            self.current_token = lexer.get_next_token()
-        else:
-            self.lexer = None
-            self.current_token = 'EOF'
+            self.set_lexer(lexer)
+        elif tokens is not None:
+            self.set_tokens(tokens)
         self.current_scope = list()
+        # Scope of the semantic module for current_scope, see SemanticModule.get_scope
+        self.__scope = None
         self.__semantic_module = None
+        # False with a SyntaxOnlyModule, the checks are made by SemanticAnalyzer after parsing
+        self.__checks = True
+        self.__jobs = 1
+        # (node, body index, scope table length, scope) of bodies left for the worker processes
+        self.__deferred_bodies = list()
+        self.__lazy = False
+        # scope table entries of the parsed program, seen by the lazily parsed bodies
+        self.__lazy_table = None
+        self.__incremental = False
+        # (environment, key) of a top-level declaration -> its record from the last parse
+        self.__units = dict()
+        # False while the nodes are added to the reference index by their unit, see __parse_UNITS
+        self.__indexing = True
+        self.__arena = None
+        self.__node_factory = None
 
+    # The parser only looks at token kinds, values are read from the stream on demand
     def __next_token(self):
-        self.current_token = self.lexer.get_next_token()
+        if self.__index < self.__last:
+            self.__index += 1
+            self.current_kind = self.__kinds[self.__index]
+
+    def __move_to(self, index):
+        self.__index = index
+        self.current_kind = self.__kinds[index]
+
+    @property
+    def current_token(self):
+        if self.tokens is None:
+            return ('EOF', 'eof', 0, 0)
+        return self.tokens.token(self.__index)
     
     def __expect(self, _expected):
-        if self.current_token[0] != _expected:
-            self.__raise_exception(f'Unexpected token: expect {_expected}: got {self.current_token[0]}')
+        if self.current_kind != _expected:
+            self.__raise_exception(f'Unexpected token: expect {_expected.name}: got {TokenKind(self.current_kind).name}')
         return True
 
     def __expect_and_move(self, _expected):
@@ -28,18 +93,25 @@ class Parser:
         return True
     
     def __check(self, _expected):
-        return self.current_token[0] == _expected
+        return self.current_kind == _expected
     
     def __check_all(self, _expected_list):
-        return self.current_token[0] in _expected_list
+        return self.current_kind in _expected_list
 
     def __pop_token(self):
-        token = self.current_token[0]
+        token = self.current_kind
         self.__next_token()
         return token
 
     def __pop_value(self):
-        identifier = self.current_token[1]
+        identifier = self.tokens.value(self.__index)
+        self.__next_token()
+        return identifier
+
+    # Identifier as it is spelled in the source, one string object per spelling (see
+    # lexer.SymbolTable): the semantic module finds its symbol id by the object
+    def __pop_identifier(self):
+        identifier = self.tokens.symbol(self.__index)
         self.__next_token()
         return identifier
 
@@ -49,86 +121,188 @@ class Parser:
     def __raise_exception(self, message):
         raise AttributeError(f'Parse error: {message}')
 
+    # A SyntaxOnlyModule only builds the tree, see SemanticAnalyzer. The whole tree is parsed
+    # in this process then, without an arena or shared nodes, for the analyzer to annotate it
     def set_semantic_module(self, semantic_module):
         self.__semantic_module = semantic_module
+        self.__checks = not isinstance(semantic_module, SyntaxOnlyModule)
+
+    def __set_scope(self, names):
+        self.__semantic_module.set_symbol_table(self.tokens.symbols)
+        self.current_scope = list(names)
+        self.__scope = self.__semantic_module.get_scope(self.current_scope)
+
+    def __enter_scope(self, name):
+        self.current_scope.append(name)
+        self.__scope = self.__semantic_module.get_scope((name,), self.__scope)
+
+    def __leave_scope(self):
+        self.current_scope.pop()
+        self.__scope = self.__scope.parent
+
+    # Parse the bodies of global subroutines in `jobs` processes, all cores by default.
+    # 1 parses everything in this process
+    def set_jobs(self, jobs = None):
+        self.__jobs = jobs or os.cpu_count()
+
+    # Parse the bodies of global subroutines only when the tree first touches them,
+    # see NodeLazySubroutine. Their errors are raised then, and their local
+    # declarations are added to the scope table then
+    def set_lazy(self, lazy = True):
+        self.__lazy = lazy
+
+    # Make parse() reuse the top-level declarations that did not change since the last parse
+    # of this parser, together with their scope table entries, see __parse_UNITS.
+    # The reused nodes are shared with the previous tree. Bodies are not lazy or parallel then
+    def set_incremental(self, incremental = True):
+        self.__incremental = incremental
+        self.__units = dict()
+
+    # Store the tree in `arena` (see NodeArena), parse() returns a view of its root.
+    # Top-level declarations are moved there as soon as they are parsed, unless their
+    # bodies are parsed later by other processes. Lazy bodies are parsed when moved
+    def set_arena(self, arena : NodeArena = None):
+        self.__arena = arena
+
+    # Build the expression nodes through `factory` (see NodeFactory): structurally equal
+    # expressions become one shared read-only node. Bodies parsed by other processes are not shared
+    def set_node_factory(self, factory : NodeFactory = None):
+        self.__node_factory = factory
+
+    # Add `node` to the reference index of the semantic module (see SemanticModule.add_reference).
+    # The nodes moved to an arena are not indexed
+    def __add_reference(self, node):
+        if self.__indexing and self.__arena is None:
+            self.__semantic_module.add_reference(node)
+
+    def __share(self, node):
+        if self.__node_factory is None or not self.__checks:
+            return node
+        return self.__node_factory.share(node)
 
     def set_lexer(self, lexer):
         self.lexer = lexer
-        self.current_token = lexer.get_next_token()
+        self.set_tokens(lexer.tokenize())
+
+    # Parse an already lexed TokenStream, e.g. one kept up to date by Lexer.retokenize
+    def set_tokens(self, tokens):
+        self.tokens = tokens
+        self.__kinds = tokens.kinds
+        self.__last = len(tokens) - 1
+        self.__index = 0
+        self.current_kind = tokens.kinds[0]
+
+    # Parse str/bytes/memoryview source text without going through a file
+    def set_source(self, source):
+        self.set_lexer(Lexer(source=source, engine=Lexer.ENGINE_REGEX))
     
     def parse(self):
-        if not self.__check('EOF'):
+        if self.__checks:
+            self.__semantic_module.set_indexed_tree(None)
+        if self.tokens is not None:
+            self.__move_to(0)
+        if not self.__check(Kind.EOF):
             main_node = self._parse_prog()
         else:
             main_node = MainNode()
+        if self.__arena is not None and self.__checks:
+            main_node = self.__arena.add(main_node)
+        elif self.__checks:
+            self.__semantic_module.set_indexed_tree(main_node)
         return main_node
     
     def _parse_prog(self):
         node = NodeProgram()
-        if self.__check('PROGRAM'):
+        self.__set_scope(())
+        self.__lazy_table = None
+        if self.__check(Kind.PROGRAM):
             self.__next_token()
-            node.identifier = self.__pop_value()
-            self.__expect_and_move('SEMICOLON')
-        node.global_declaration = self._parse_declaration_part()
-        self.current_scope.append(node.identifier)
+            node.identifier = self.__pop_identifier()
+            self.__expect_and_move(Kind.SEMICOLON)
+        if self.__incremental:
+            # the scope table is built again from the reused and the parsed declarations
+            self.__semantic_module.set_scope_table(dict())
+            units = None if self.tokens.positions else self.__find_UNITS(self.__index)
+            if units is not None and self.__parse_UNITS(node, units):
+                return node
+            # the declarations get new scope table entries, the records of the units are left
+            self.__units = dict()
+            self.__semantic_module.clear_references()
+        try:
+            node.global_declaration = self._parse_declaration_part()
+        except Exception:
+            # a deferred body before the failed declaration holds the first error
+            self.__parse_DEFERRED_BODIES()
+            raise
+        self.__parse_DEFERRED_BODIES()
+        self.__enter_scope(node.identifier)
         node.statement_part = self.__parse_STATEMENT_BLOCK()
-        self.__expect_and_move('DOT')
+        self.__expect_and_move(Kind.DOT)
         return node
 
     def _parse_declaration_part(self):
         declaration_list = list()
-        while not self.__check('BEGIN'):
-            match self.current_token[0]:
-                case 'VAR':
+        # top-level declarations go to the arena one by one, so their nodes do not pile up
+        pack = self.__arena is not None and self.__checks and self.__jobs == 1 and not self.__lazy and not self.current_scope
+        packed = 0
+        while not self.__check(Kind.BEGIN):
+            match self.current_kind:
+                case Kind.VAR:
                     self.__next_token()
-                    while self.__check('IDENTIFIER'):
+                    while self.__check(Kind.IDENTIFIER):
                         declaration_list.extend(self.__parse_VAR_statement())
-                        self.__expect_and_move('SEMICOLON')
-                case 'TYPE':
+                        self.__expect_and_move(Kind.SEMICOLON)
+                case Kind.TYPE:
                     self.__next_token()
-                    while self.__check('IDENTIFIER'):
+                    while self.__check(Kind.IDENTIFIER):
                         declaration_list.append(self.__parse_TYPE_statement())
-                        self.__expect_and_move('SEMICOLON')
-                case 'CONST':
+                        self.__expect_and_move(Kind.SEMICOLON)
+                case Kind.CONST:
                     self.__next_token()
-                    while self.__check('IDENTIFIER'):
+                    while self.__check(Kind.IDENTIFIER):
                         declaration_list.append(self.__parse_CONST_statement())
-                        self.__expect_and_move('SEMICOLON')
-                case 'PROCEDURE' | 'FUNCTION':
+                        self.__expect_and_move(Kind.SEMICOLON)
+                case Kind.PROCEDURE | Kind.FUNCTION:
                     declaration_list.append(self.__parse_SUBROUTINE())
                 case _:
                     self.__raise_exception('Impossible to parse declaration part. Infinity loop')
+            if pack:
+                declaration_list[packed:] = map(self.__arena.add, declaration_list[packed:])
+                packed = len(declaration_list)
         return NodeDeclarationPart(declaration_list)
 
     # Parsing VAR declaration
     def __parse_VAR_statement(self):
         identifiers = []
-        while not self.__check('COLON'):
-            self.__expect('IDENTIFIER')
-            identifiers.append(self.__pop_value())
-            if self.__check('COMMA'):
+        while not self.__check(Kind.COLON):
+            self.__expect(Kind.IDENTIFIER)
+            identifiers.append(self.__pop_identifier())
+            if self.__check(Kind.COMMA):
                 self.__next_token()
         self.__next_token()
         _type = self.__parse_type()
-        if self.__check('ASSIGN'):
+        if self.__check(Kind.ASSIGN):
             raise Error('Not implement Variable assign')
-        for identifier in identifiers:
-            self.__semantic_module.add_variable(self.current_scope, identifier, _type)
+        symbols = [self.__semantic_module.add_variable(self.__scope, identifier, _type) for identifier in identifiers]
         if not isinstance(_type, NodeArrayType):
             _type = str(_type)
         variables = [NodeVariableDeclaration(identifier, _type) for identifier in identifiers]
+        for variable, symbol in zip(variables, symbols):
+            variable.symbol = symbol
+            self.__add_reference(variable)
         # Add declaration to scope
         return variables
     
     # Parsing CONST declaration
     def __parse_CONST_statement(self):
         node = NodeConstantDeclaration()
-        self.__expect('IDENTIFIER')
-        node.identifier = self.__pop_value()
-        self.__expect_and_move('EQUALITY')
+        self.__expect(Kind.IDENTIFIER)
+        node.identifier = self.__pop_identifier()
+        self.__expect_and_move(Kind.EQUALITY)
         node.expression = self.__parse_CONDITION()
-        node.type = self.__semantic_module.predict_condition_type(node.expression, self.current_scope)
-        self.__semantic_module.add_variable(self.current_scope, node.identifier, node.type, True)
+        node.type = self.__semantic_module.predict_condition_type(node.expression, self.__scope)
+        node.symbol = self.__semantic_module.add_variable(self.__scope, node.identifier, node.type, True)
+        self.__add_reference(node)
         if not isinstance(node.type, NodeArrayType):
             node.type = str(node.type)
         return node
@@ -136,169 +310,443 @@ class Parser:
     # Parsing TYPE declaration
     def __parse_TYPE_statement(self):
         node = NodeTypeDeclaration()
-        self.__expect('IDENTIFIER')
-        node.identifier = self.__pop_value()
-        self.__expect_and_move('EQUALITY')
+        self.__expect(Kind.IDENTIFIER)
+        node.identifier = self.__pop_identifier()
+        self.__expect_and_move(Kind.EQUALITY)
         node.type = self.__parse_type()
-        self.__semantic_module.add_type(self.current_scope, node.identifier, node.type)
+        node.symbol = self.__semantic_module.add_type(self.__scope, node.identifier, node.type)
+        self.__add_reference(node)
         if not isinstance(node.type, NodeArrayType):
             node.type = str(node.type)
-        else:
+        elif self.__checks:
+            # without the checks the analyzer needs the element type, it converts it itself
             node.type.type = str(node.type.type)
         return node
 
     def __parse_SUBROUTINE(self):
         node = NodeSubroutine()
-        node.subroutine_type = SubroutineType(self.__pop_token())
-        self.__expect('IDENTIFIER')
-        node.identifier = self.__pop_value()
-        self.__expect_and_move('LPAREN')
-        self.current_scope.append(node.identifier)
+        node.subroutine_type = Parser.SUBROUTINE_TYPES[self.__pop_token()]
+        self.__expect(Kind.IDENTIFIER)
+        node.identifier = self.__pop_identifier()
+        self.__expect_and_move(Kind.LPAREN)
+        self.__enter_scope(node.identifier)
         node.formal_params = self.__parse_SUBROUTINE_FORMAL_PARAMS()
-        self.__expect_and_move('RPAREN')
+        self.__expect_and_move(Kind.RPAREN)
         if node.subroutine_type == SubroutineType.FUNCTION:
-            self.__expect_and_move('COLON')
+            self.__expect_and_move(Kind.COLON)
             node.type = self.__parse_type()
         else:
             node.type = PrimitiveType.UNDEFINED
-        self.__semantic_module.add_subroutine(self.current_scope[:-1], node.identifier, node.type, node.formal_params)
+        node.symbol = self.__semantic_module.add_subroutine(self.__scope.parent, node.identifier, node.type, node.formal_params)
         if not isinstance(node.type, NodeArrayType):
             node.type = str(node.type)
-        self.__expect_and_move('SEMICOLON')
-        if self.__check('FORWARD'):
+        self.__expect_and_move(Kind.SEMICOLON)
+        if self.__check(Kind.FORWARD):
             self.__next_token()
             node.is_forward_declaration = True
         else:
-            node.declaration_part = self._parse_declaration_part()
-            self.__expect('BEGIN')
-            node.statement_part = self.__parse_STATEMENT_BLOCK()
-            self.__expect_and_move('SEMICOLON')
-        self.current_scope.pop()
+            end = None
+            if (self.__lazy or self.__jobs > 1) and self.__checks and not self.__incremental and len(self.current_scope) == 1:
+                end = self.__find_SUBROUTINE_END(self.__index)
+            if end is None:
+                node.declaration_part, node.statement_part = self.__parse_SUBROUTINE_BODY()
+            else:
+                body = (self.__index, len(self.__semantic_module.get_scope_table()), tuple(self.current_scope))
+                if self.__lazy:
+                    node = NodeLazySubroutine(node, partial(self.__parse_LAZY_BODY, *body))
+                else:
+                    self.__deferred_bodies.append((node, *body))
+                self.__move_to(end)
+            self.__expect_and_move(Kind.SEMICOLON)
+        self.__leave_scope()
+        self.__add_reference(node)
         return node
 
+    def __parse_SUBROUTINE_BODY(self):
+        declaration_part = self._parse_declaration_part()
+        self.__expect(Kind.BEGIN)
+        return declaration_part, self.__parse_STATEMENT_BLOCK()
+
+    # Body of the subroutine `scope` starting at token `index`, as parsed by a worker process
+    def parse_subroutine_body(self, index, scope):
+        self.__move_to(index)
+        self.__set_scope(scope)
+        body = self.__parse_SUBROUTINE_BODY()
+        self.__expect(Kind.SEMICOLON)
+        return body
+
+    def __parse_LAZY_BODY(self, index, scope_length, scope):
+        if self.__lazy_table is None:
+            self.__lazy_table = BodyScopeTable(list(self.__semantic_module.get_scope_table().items()), self.tokens.symbols)
+        declaration_part, statement_part, declared = _parse_body(self.__lazy_table, self.tokens, index, scope_length, scope)
+        self.__lazy_table.use_counts.clear()
+        self.__semantic_module.update_scope_table(declared)
+        if self.__arena is None:
+            self.__semantic_module.add_references(declaration_part)
+            self.__semantic_module.add_references(statement_part)
+        return declaration_part, statement_part
+
+    # Index of the token after the `;` that ends the subroutine header at `index`
+    def __find_HEADER_END(self, index):
+        kinds = self.__kinds
+        search = Parser.HEADER_KINDS.search
+        depth = 0
+        while True:
+            index = search(kinds, index).start()
+            if kinds[index] == Kind.SEMICOLON:
+                if not depth:
+                    return index + 1
+            elif kinds[index] == Kind.LPAREN:
+                depth += 1
+            elif kinds[index] == Kind.RPAREN:
+                depth -= 1
+            else:
+                return None
+            index += 1
+
+    # Index of the token after the body starting at `index`, found by matching begin/case with
+    # end and skipping nested subroutines without parsing. None if the file ends before
+    def __find_SUBROUTINE_END(self, index):
+        kinds = self.__kinds
+        # declaration part, nested subroutines are skipped header and body
+        index = Parser.DECLARATION_KINDS.search(kinds, index).start()
+        while kinds[index] != Kind.BEGIN:
+            if kinds[index] == Kind.EOF:
+                return None
+            index = self.__find_HEADER_END(index)
+            if index is None:
+                return None
+            if kinds[index] != Kind.FORWARD:
+                index = self.__find_SUBROUTINE_END(index)
+                if index is None:
+                    return None
+            index = Parser.DECLARATION_KINDS.search(kinds, index).start()
+        depth = 0
+        search = Parser.BLOCK_KINDS.search
+        while True:
+            index = search(kinds, index).start()
+            if kinds[index] == Kind.END:
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            elif kinds[index] == Kind.EOF:
+                return None
+            else:
+                depth += 1
+            index += 1
+
+    # Top-level declarations as (section kind, first token, header end, end) token ranges,
+    # the main block last with BEGIN as its kind. None if they can not be told apart without parsing
+    def __find_UNITS(self, index):
+        kinds = self.__kinds
+        units = list()
+        section = None
+        while kinds[index] != Kind.BEGIN:
+            kind = kinds[index]
+            if kind == Kind.VAR or kind == Kind.TYPE or kind == Kind.CONST:
+                section = kind
+                index += 1
+            elif kind == Kind.IDENTIFIER and section is not None:
+                try:
+                    end = kinds.index(Kind.SEMICOLON, index) + 1
+                except ValueError:
+                    return None
+                units.append((section, index, end, end))
+                index = end
+            elif kind == Kind.PROCEDURE or kind == Kind.FUNCTION:
+                header = self.__find_HEADER_END(index)
+                end = header and self.__find_SUBROUTINE_END(header)
+                if end is None or kinds[end] != Kind.SEMICOLON:
+                    return None
+                units.append((kind, index, header, end + 1))
+                index = end + 1
+                section = None
+            else:
+                return None
+        end = self.__find_SUBROUTINE_END(index)
+        if end is None or kinds[end] != Kind.DOT:
+            return None
+        units.append((Kind.BEGIN, index, end + 1, end + 1))
+        return units
+
+    # Parse the top-level declarations and the main block one by one. A declaration is reused
+    # when its text and the interfaces before it (declarations and subroutine headers) are those
+    # of the last parse: its nodes and scope table entries are taken as they are. Every record
+    # keeps the use counts of its entries and the uses it added to the entries of the others,
+    # so the counts come out as after a full parse. False if the units did not match the parse.
+    # The reference index keeps the nodes of the records: those of a parsed unit are added
+    # when it is recorded, those of the records not reused are removed
+    def __parse_UNITS(self, node, units):
+        previous = self.__units
+        if not previous:
+            # nothing is kept from the last parse, e.g. it failed before the units
+            self.__semantic_module.clear_references()
+        self.__indexing = False
+        try:
+            return self.__parse_UNIT_RECORDS(node, units)
+        finally:
+            self.__indexing = True
+            kept = set(map(id, self.__units.values()))
+            for record in previous.values():
+                if id(record) not in kept:
+                    self.__index_UNIT(record[0], False)
+
+    # Add or remove the references of the nodes of a unit
+    def __index_UNIT(self, nodes, add):
+        if self.__arena is not None:
+            return
+        module = self.__semantic_module
+        for node in nodes if isinstance(nodes, list) else (nodes,):
+            if add:
+                module.add_references(node)
+            else:
+                module.remove_references(node)
+
+    def __parse_UNIT_RECORDS(self, node, units):
+        previous, self.__units = self.__units, dict()
+        table = UseCountTable()
+        self.__semantic_module.set_scope_table(table)
+        # id of a scope table entry -> its name
+        names = dict()
+        records = list()
+        first = self.__index
+        source = self.tokens.source
+        span = self.tokens.span
+        environment = 0
+        for section, start, header, end in units:
+            text_start = span(start)[0]
+            key = hash((section, source[text_start:span(end - 1)[1]]))
+            record = previous.get((environment, key))
+            if record is None:
+                self.__move_to(start)
+                length = len(table)
+                nodes = self.__parse_UNIT(section, node)
+                if self.__index != end:
+                    self.__move_to(first)
+                    self.__set_scope(())
+                    self.__semantic_module.set_scope_table(dict())
+                    return False
+                declared = list(islice(reversed(table.items()), len(table) - length))[::-1]
+                own_counts = [variable.use_count for _, variable in declared]
+                own_names = [(id(variable), name) for name, variable in declared]
+                own = dict(own_names)
+                uses = [(names[id(variable)], variable.use_count - use_count)
+                        for variable, use_count in table.use_counts.values()
+                        if variable.use_count != use_count and id(variable) not in own]
+                table.use_counts.clear()
+                interface = key if header == end else hash((section, source[text_start:span(header - 1)[1]]))
+                record = (nodes, declared, own_counts, own_names, uses, interface)
+                self.__index_UNIT(nodes, True)
+            else:
+                self.__semantic_module.update_scope_table(record[1])
+            names.update(record[3])
+            self.__units[(environment, key)] = record
+            records.append(record)
+            environment = hash((environment, record[5]))
+        table = dict(table)
+        for _, declared, own_counts, _, _, _ in records:
+            for (_, variable), use_count in zip(declared, own_counts):
+                variable.use_count = use_count
+        for _, _, _, _, uses, _ in records:
+            for name, use_count in uses:
+                table[name].use_count += use_count
+        self.__semantic_module.set_scope_table(table)
+        declaration_list = list()
+        for nodes, _, _, _, _, _ in records[:-1]:
+            declaration_list.extend(nodes)
+        node.global_declaration = NodeDeclarationPart(declaration_list)
+        node.statement_part = records[-1][0]
+        return True
+
+    # Nodes of one top-level declaration, or the statement part of the main block
+    def __parse_UNIT(self, section, program):
+        match section:
+            case Kind.VAR:
+                nodes = self.__parse_VAR_statement()
+            case Kind.TYPE:
+                nodes = [self.__parse_TYPE_statement()]
+            case Kind.CONST:
+                nodes = [self.__parse_CONST_statement()]
+            case Kind.BEGIN:
+                self.__enter_scope(program.identifier)
+                statement_part = self.__parse_STATEMENT_BLOCK()
+                self.__expect_and_move(Kind.DOT)
+                return statement_part
+            case _:
+                return [self.__parse_SUBROUTINE()]
+        self.__expect_and_move(Kind.SEMICOLON)
+        return nodes
+
+    # Parse the deferred bodies in a process pool and stitch them in declaration order:
+    # their nodes, the scope table entries they declared and the use counts they changed
+    def __parse_DEFERRED_BODIES(self):
+        deferred, self.__deferred_bodies = self.__deferred_bodies, list()
+        if not deferred:
+            return
+        entries = list(self.__semantic_module.get_scope_table().items())
+        jobs = [(index, scope_length, scope) for _, index, scope_length, scope in deferred]
+        chunksize = max(1, len(jobs) // (self.__jobs * 4))
+        insertions = list()
+        # the nodes moved to an arena are not indexed, see __add_reference
+        index = self.__semantic_module if self.__arena is None else None
+        with ProcessPoolExecutor(self.__jobs, initializer=_start_body_worker,
+                                 initargs=(self.tokens, entries)) as executor:
+            # results come in declaration order, the first failed body raises its error here
+            for (node, _, scope_length, _), result in zip(deferred, executor.map(_parse_body_job, jobs, chunksize=chunksize)):
+                node.declaration_part, node.statement_part, declared = load_body_result(result, entries, index)
+                insertions.append((scope_length, declared))
+        self.__semantic_module.insert_to_scope_table(insertions)
+
     def __parse_SUBROUTINE_FORMAL_PARAMS(self):
         node = NodeSubroutineFormalParams(list())
-        while not self.__check('RPAREN'):
+        while not self.__check(Kind.RPAREN):
             node.extend(self.__parse_VAR_statement())
-            if self.__check('COMMA'):
-                self.__expect_and_move('RPAREN') # TODO убрать костыль
-            if self.__check('SEMICOLON'):
+            if self.__check(Kind.COMMA):
+                self.__expect_and_move(Kind.RPAREN) # TODO убрать костыль
+            if self.__check(Kind.SEMICOLON):
                 self.__next_token()
         return node
             
     def __parse_type(self):
-        if self.__check('ARRAY'):
+        if self.__check(Kind.ARRAY):
             self.__next_token()
             return self.__parse_ARRAY_TYPE()
-        elif self.__check('RECORD'):
+        elif self.__check(Kind.RECORD):
             self.__next_token()
             raise NotImplementedError('ИМПЛЕМЕНТИРУЙ RECORD')
-        elif PrimitiveType.__contains__(self.current_token[0]):
-            return PrimitiveType[self.__pop_token()]
+        elif self.current_kind in Parser.PRIMITIVE_TYPES:
+            return Parser.PRIMITIVE_TYPES[self.__pop_token()]
         else:
-            self.__expect('IDENTIFIER')
-            custom_type = self.__pop_value()
-            return self.__semantic_module.get_type(self.current_scope, custom_type)
+            self.__expect(Kind.IDENTIFIER)
+            custom_type = self.__pop_identifier()
+            return self.__semantic_module.get_type(self.__scope, custom_type)
     
     def __parse_ARRAY_TYPE(self):
         node = NodeArrayType(array_ranges = list())
-        self.__expect_and_move('LBR')
-        while not self.__check('RBR'):
+        self.__expect_and_move(Kind.LBR)
+        while not self.__check(Kind.RBR):
             array_range = NodeArrayRange()
             array_range.left_bound = self.__parse_FACTOR()
-            self.__expect_and_move('ARRDOT')
+            self.__expect_and_move(Kind.ARRDOT)
             array_range.right_bound = self.__parse_FACTOR()
-            if self.__check('COMMA'):
+            if self.__check(Kind.COMMA):
                 self.__next_token()
             node.append(array_range)            
         self.__next_token()
-        self.__expect_and_move('OF')
+        self.__expect_and_move(Kind.OF)
         node.type = self.__parse_type()
         return node
     
     # Parsing condition expression
     def __parse_CONDITION(self):
-        left = self.__parse_EXPRESSION()
-        while self.__check_all(Operator.get_condition_operators()):
-            operator = Operator(self.__pop_token())
-            right = self.__parse_EXPRESSION()
-            left = NodeBinaryOperator(left, right, operator)
-        return left
+        return self.__parse_OPERATION(Parser.CONDITION_PRECEDENCE)
 
     # Prasing expression
     def __parse_EXPRESSION(self):
-        left = self.__parse_TERM()
-        while self.__check_all(('PLUS', 'MINUS', 'OR', 'XOR')):
-            operator = Operator(self.__pop_token())
-            right = self.__parse_TERM()
-            left = NodeBinaryOperator(left, right, operator)
-        return left
-
-    # Parsing term
-    def __parse_TERM(self):
-        left = self.__parse_FACTOR()
-        while self.__check_all(('MULTIPLY', 'DIVIDE','DIV', 'MOD', 'AND', 'SHL', 'SHR')):
-            operator = Operator(self.__pop_token())
-            right = self.__parse_FACTOR()
-            left = NodeBinaryOperator(left, right, operator)
-        return left
+        return self.__parse_OPERATION(Parser.EXPRESSION_PRECEDENCE)
 
     # Parsing factor
     def __parse_FACTOR(self):
-        match self.current_token[0]:
-            case 'NUMBER':
+        return self.__parse_OPERATION(Parser.FACTOR_PRECEDENCE)
+
+    # Precedence climbing over BINARY_PRECEDENCE. Operands and operators wait on explicit
+    # stacks and operators of the same precedence group to the left, a parenthesized
+    # group saves the enclosing stacks in a frame instead of recursing
+    def __parse_OPERATION(self, min_precedence):
+        precedence_of = Parser.BINARY_KIND_PRECEDENCE
+        frames = []
+        operands, operators = [], []
+        while True:
+            unary_operators = []
+            while self.current_kind in Parser.UNARY_OPERATORS:
+                unary_operators.append(Parser.UNARY_OPERATORS[self.__pop_token()])
+            if self.current_kind == Kind.LPAREN:
+                self.__next_token()
+                frames.append((min_precedence, operands, operators, unary_operators))
+                min_precedence, operands, operators = Parser.CONDITION_PRECEDENCE, [], []
+                continue
+            operand = self.__parse_VALUE()
+            if unary_operators:
+                operand = self.__apply_UNARY_OPERATORS(unary_operators, operand)
+            operands.append(operand)
+            precedence = precedence_of.get(self.current_kind)
+            while precedence is None or precedence < min_precedence:
+                # end of the expression or of the innermost parenthesized group
+                while operators:
+                    right = operands.pop()
+                    operands[-1] = self.__share(NodeBinaryOperator(operands[-1], right, operators.pop()))
+                if not frames:
+                    return operands[0]
+                self.__expect_and_move(Kind.RPAREN)
+                operand = operands[0]
+                min_precedence, operands, operators, unary_operators = frames.pop()
+                if unary_operators:
+                    operand = self.__apply_UNARY_OPERATORS(unary_operators, operand)
+                operands.append(operand)
+                precedence = precedence_of.get(self.current_kind)
+            while operators and Parser.BINARY_PRECEDENCE[operators[-1]] >= precedence:
+                right = operands.pop()
+                operands[-1] = self.__share(NodeBinaryOperator(operands[-1], right, operators.pop()))
+            operators.append(Parser.BINARY_OPERATORS[self.__pop_token()])
+
+    # Parsing value, variable or subroutine/array call
+    def __parse_VALUE(self):
+        match self.current_kind:
+            case Kind.INTEGER_VAL | Kind.REAL_VAL:
+                # the lexer tells integers from reals, the type comes from the parsed value
+                _type = self.tokens.number(self.__index)[1]
+                value = self.__pop_value()
+                if _type is None:
+                    _type = self.__semantic_module.return_value_type(value)
+                return self.__share(NodeValue(value, _type))
+            case Kind.NUMBER:
                 possible_number = self.__pop_value()
                 _type = self.__semantic_module.return_value_type(possible_number)
-                return NodeValue(possible_number, _type)
-            case 'STRING_VAL':
-                return NodeValue(self.__pop_value(), PrimitiveType.STRING)
-            case 'CHAR_VAL':
-                return NodeValue(self.__pop_value(), PrimitiveType.CHAR)
-            case 'TRUE' | 'FALSE':
-                return NodeValue(self.__pop_value(), PrimitiveType.BOOLEAN)
-            case 'LPAREN':
-                self.__next_token()
-                condition = self.__parse_CONDITION()
-                self.__expect_and_move('RPAREN')
-                return condition
-            case 'MINUS' | 'PLUS' | 'NOT':
-                return self.__parse_UNARY_OPERATOR()
+                return self.__share(NodeValue(possible_number, _type))
+            case Kind.STRING_VAL:
+                return self.__share(NodeValue(self.__pop_value(), PrimitiveType.STRING))
+            case Kind.CHAR_VAL:
+                return self.__share(NodeValue(self.__pop_value(), PrimitiveType.CHAR))
+            case Kind.TRUE | Kind.FALSE:
+                return self.__share(NodeValue(self.__pop_value(), PrimitiveType.BOOLEAN))
             case _:
-                self.__expect('IDENTIFIER')
+                self.__expect(Kind.IDENTIFIER)
                 return self.__parse_IDENTIFIER_STATEMENT()
 
-    def __parse_UNARY_OPERATOR(self):
-        operator = Operator[self.__pop_token()]
-        factor = self.__parse_FACTOR()
-        match operator:
-            case Operator.PLUS:
-                self.__semantic_module.check_type_operation_support(factor, Operator.UNARY_PLUS, self.current_scope)
-                node = factor
-            case Operator.MINUS:
-                if isinstance(factor, NodeValue):
-                    self.__semantic_module.check_type_operation_support(factor, Operator.UNARY_MINUS)
-                    factor.value = '-' + factor.value
-                    factor.type = self.__semantic_module.return_value_type(factor.value)
-                    node = factor
-                else:
-                    node = NodeUnaryOperator(factor, Operator.UNARY_MINUS)
-            case Operator.NOT:
-                if isinstance(factor, NodeValue):
-                    new_value = not self.__semantic_module.convert_to_bool(factor.value)
-                    node = NodeValue(str(new_value), PrimitiveType.BOOLEAN)
-                else:
-                    node = NodeUnaryOperator(factor, Operator.NOT)
-        return node
+    # Prefix operators are applied innermost first, literals are folded
+    def __apply_UNARY_OPERATORS(self, operators, factor):
+        while operators:
+            match operators.pop():
+                case Operator.PLUS:
+                    self.__semantic_module.check_type_operation_support(factor, Operator.UNARY_PLUS, self.__scope)
+                case Operator.MINUS:
+                    if isinstance(factor, NodeValue):
+                        self.__semantic_module.check_type_operation_support(factor, Operator.UNARY_MINUS)
+                        factor = writable(factor)
+                        factor.value = '-' + factor.value
+                        factor.type = self.__semantic_module.return_value_type(factor.value)
+                        factor = self.__share(factor)
+                    else:
+                        factor = self.__share(NodeUnaryOperator(factor, Operator.UNARY_MINUS))
+                case Operator.NOT:
+                    if isinstance(factor, NodeValue):
+                        new_value = not self.__semantic_module.convert_to_bool(factor.value)
+                        factor = self.__share(NodeValue(str(new_value), PrimitiveType.BOOLEAN))
+                    else:
+                        factor = self.__share(NodeUnaryOperator(factor, Operator.NOT))
+        return factor
 
     # Parinsg variable or Subroutine/array call
     def __parse_IDENTIFIER_STATEMENT(self):    
-        self.__expect('IDENTIFIER')
-        left = NodeVariable(self.__pop_value())
-        # Проверка на существование переменной
-        self.__semantic_module.get_variable(self.current_scope, left.identifier)
-        while self.__check_all(('ASSIGN', 'LPAREN', 'LBR', 'DOT')):
-            match self.current_token[0]:
-                case 'ASSIGN':
+        self.__expect(Kind.IDENTIFIER)
+        left = NodeVariable(self.__pop_identifier())
+        # Проверка на существование переменной, найденная запоминается в узле
+        left.symbol = self.__semantic_module.get_variable(self.__scope, left.identifier)
+        left = self.__share(left)
+        self.__add_reference(left)
+        while self.current_kind in Parser.IDENTIFIER_SUFFIXES:
+            match self.current_kind:
+                case Kind.ASSIGN:
                     self.__next_token()
                     self.__semantic_module.use_count_score += 1
                     right = self.__parse_CONDITION()
@@ -306,23 +754,23 @@ class Parser:
                     variable = left
                     while not isinstance(variable, NodeVariable):
                         variable = variable.left
-                    self.__semantic_module.check_assign(self.current_scope, variable.identifier, right)
+                    self.__semantic_module.check_assign(self.__scope, variable.identifier, right)
                     left = NodeBinaryOperator(left, right, Operator.ASSIGN)
-                case 'LPAREN':
+                case Kind.LPAREN:
                     self.__next_token()
                     self.__semantic_module.use_count_score += 1
                     right = self.__parse_SUBROUTINE_CALL_PARAMS()
                     self.__semantic_module.use_count_score -= 1
-                    self.__semantic_module.check_subroutine_call(self.current_scope, left.identifier, right)
-                    left = NodeBinaryOperator(left, right, Operator.SUBROUTINE_CALL)
-                case 'LBR':
+                    self.__semantic_module.check_subroutine_call(self.__scope, left.identifier, right)
+                    left = self.__share(NodeBinaryOperator(left, right, Operator.SUBROUTINE_CALL))
+                case Kind.LBR:
                     self.__next_token()
                     self.__semantic_module.use_count_score += 1
                     right = self.__parse_ARRAY_CALL()
                     self.__semantic_module.use_count_score -= 1
-                    self.__semantic_module.check_array_access(self.current_scope, left.identifier, right)
-                    left = NodeBinaryOperator(left, right, Operator.ARRAY_CALL)
-                case 'DOT':
+                    self.__semantic_module.check_array_access(self.__scope, left.identifier, right)
+                    left = self.__share(NodeBinaryOperator(left, right, Operator.ARRAY_CALL))
+                case Kind.DOT:
                     raise NotImplementedError('ИМПЛЕМЕНТИРУЙ ОБРАЩЕНИЕ К ОБЪЕКТУ')
         return left
 
@@ -330,95 +778,117 @@ class Parser:
     def __parse_SUBROUTINE_CALL_PARAMS(self):
         node = NodeCallParams(list())
         self.__semantic_module.use_count_score += 1
-        while not self.__check('RPAREN'):
+        while not self.__check(Kind.RPAREN):
             node.append(self.__parse_CONDITION())
-            if self.__check('COMMA'):
+            if self.__check(Kind.COMMA):
                 self.__next_token()
         self.__semantic_module.use_count_score -= 1
         self.__next_token()
-        return node
+        return self.__share(node)
 
     def __parse_ARRAY_CALL(self):
         node = NodeCallParams(list())
         self.__semantic_module.use_count_score += 1
-        while not self.__check('RBR'):
+        while not self.__check(Kind.RBR):
             node.append(self.__parse_EXPRESSION())
-            if self.__check('COMMA'):
+            if self.__check(Kind.COMMA):
                 self.__next_token()
         self.__semantic_module.use_count_score -= 1
         self.__next_token()
-        return node
+        return self.__share(node)
 
-    # Parsing statement block
+    # Parsing statement block. Statements nest without recursion: compound statements are
+    # generators which yield the nested statement or block they need and get the node back
     def __parse_STATEMENT_BLOCK(self):
+        statement_block = self.__STATEMENT_BLOCK()
+        if type(statement_block) is GeneratorType:
+            statement_block = self.__run_STATEMENTS(statement_block)
+        return statement_block
+
+    # Trampoline over an explicit stack of statement generators
+    def __run_STATEMENTS(self, generator):
+        stack = [generator]
+        result = None
+        while stack:
+            try:
+                request = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            if type(request) is GeneratorType:
+                stack.append(request)
+                result = None
+            else:
+                # already parsed, e.g. a block of one simple statement
+                result = request
+        return result
+
+    # Generator for the block, or the finished block when it is a single simple statement
+    def __STATEMENT_BLOCK(self):
+        if self.current_kind == Kind.BEGIN:
+            return self.__BEGIN_END_BLOCK()
+        statement = self.__parse_STATEMENT()
+        if type(statement) is GeneratorType:
+            return self.__SINGLE_STATEMENT_BLOCK(statement)
+        return NodeStatementPart([statement])
+
+    def __SINGLE_STATEMENT_BLOCK(self, statement):
+        return NodeStatementPart([(yield statement)])
+
+    def __BEGIN_END_BLOCK(self):
         statement_block = NodeStatementPart(list())
-        if self.__check('BEGIN'):
-            self.__next_token()
-            while not self.__check('END'):
-                statement_block.append(self.__parse_STATEMENT())
-                if self.__check('SEMICOLON'):
-                    self.__next_token()
-                else:
-                    self.__expect('END')
-            self.__next_token()
-        else:
-            statement_block.append(self.__parse_STATEMENT())
+        self.__next_token()
+        while self.current_kind != Kind.END:
+            statement = self.__parse_STATEMENT()
+            if type(statement) is GeneratorType:
+                statement = yield statement
+            statement_block.append(statement)
+            if self.current_kind == Kind.SEMICOLON:
+                self.__next_token()
+            else:
+                self.__expect(Kind.END)
+        self.__next_token()
         return statement_block
 
+    # Generator for compound statements, the node itself for the others
     def __parse_STATEMENT(self):
-        match self.current_token[0]:
-            case 'LCOM':
-                self.__next_token()
-                pass
-            case 'IF':
-                self.__next_token()
-                node = self.__parse_IF_STATEMENT()
-            case 'CASE':
-                self.__next_token()
-                node = self.__parse_CASE_STATEMENT()
-            case 'FOR':
-                self.__next_token()
-                node = self.__parse_FOR_STATEMENT()
-            case 'WHILE':
-                self.__next_token()
-                node = self.__parse_WHILE_STATEMENT()
-            case 'REPEAT':
-                self.__next_token()
-                node = self.__parse_REPEAT_STATEMENT()
-            case _: 
-                node = self.__parse_IDENTIFIER_STATEMENT()
-        return node
+        statement_parser = Parser.STATEMENT_PARSERS.get(self.current_kind)
+        if statement_parser is None:
+            return self.__parse_IDENTIFIER_STATEMENT()
+        self.__next_token()
+        return statement_parser(self)
 
     def __parse_IF_STATEMENT(self):
         self.__semantic_module.use_count_score += 1
         node = NodeIfStatement()
         node.condition = self.__parse_CONDITION()
-        self.__expect_and_move('THEN')
+        self.__expect_and_move(Kind.THEN)
         self.__semantic_module.use_count_score -= 1
-        node.then_statement_part = self.__parse_STATEMENT_BLOCK()
-        if self.__check('ELSE'):
+        node.then_statement_part = yield self.__STATEMENT_BLOCK()
+        if self.__check(Kind.ELSE):
             self.__next_token()
-            node.else_statement_part = self.__parse_STATEMENT_BLOCK()
+            node.else_statement_part = yield self.__STATEMENT_BLOCK()
         return node
 
     def __parse_CASE_STATEMENT(self):
         node = NodeSwitchStatement(None, list())
-        self.__expect('IDENTIFIER')
-        node.variable = NodeVariable(self.__pop_value())
-        self.__expect_and_move('OF')
-        while not self.__check('END'):
-            if self.__check('ELSE'):
+        self.__expect(Kind.IDENTIFIER)
+        node.variable = NodeVariable(self.__pop_identifier())
+        self.__expect_and_move(Kind.OF)
+        while not self.__check(Kind.END):
+            if self.__check(Kind.ELSE):
                 self.__next_token()
-                node.default_block = self.__parse_STATEMENT_BLOCK()
+                node.default_block = yield self.__STATEMENT_BLOCK()
             else:
                 case_block = NodeCaseBlock(list(), None)
-                while not self.__check('COLON'):
+                while not self.__check(Kind.COLON):
                     case_block.append_case(self.__parse_EXPRESSION())
-                    if self.__check('COMMA'):
+                    if self.__check(Kind.COMMA):
                         self.__next_token()
                 self.__next_token()
-                case_block.statement_part = self.__parse_STATEMENT_BLOCK()
-            self.__expect_and_move('SEMICOLON')
+                case_block.statement_part = yield self.__STATEMENT_BLOCK()
+            self.__expect_and_move(Kind.SEMICOLON)
             node.append(case_block)
         self.__next_token()
         return node
@@ -426,19 +896,20 @@ class Parser:
     def __parse_FOR_STATEMENT(self):
         self.__semantic_module.use_count_score += 1
         node = NodeForStatement()
-        self.__expect('IDENTIFIER')
-        node.variable = NodeVariable(self.__pop_value())
-        self.__semantic_module.get_variable(self.current_scope, node.variable.identifier)
-        if self.__check('ASSIGN'):
+        self.__expect(Kind.IDENTIFIER)
+        node.variable = NodeVariable(self.__pop_identifier())
+        node.variable.symbol = self.__semantic_module.get_variable(self.__scope, node.variable.identifier)
+        self.__add_reference(node.variable)
+        if self.__check(Kind.ASSIGN):
             self.__next_token()
             expression = self.__parse_EXPRESSION()
-            self.__semantic_module.check_assign(self.current_scope, node.variable.identifier, expression)
+            self.__semantic_module.check_assign(self.__scope, node.variable.identifier, expression)
             node.initial_expression = expression
-        self.__expect_and_move('TO')
+        self.__expect_and_move(Kind.TO)
         node.end_expression = self.__parse_EXPRESSION()
         self.__semantic_module.use_count_score -= 1
-        self.__expect_and_move('DO')
-        node.statement_part = self.__parse_STATEMENT_BLOCK()
+        self.__expect_and_move(Kind.DO)
+        node.statement_part = yield self.__STATEMENT_BLOCK()
         return node
 
     def __parse_WHILE_STATEMENT(self):
@@ -446,21 +917,59 @@ class Parser:
         node = NodeWhileStatement()
         node.condition = self.__parse_CONDITION()
         self.__semantic_module.use_count_score -= 1
-        self.__expect_and_move('DO')
-        node.statement_part = self.__parse_STATEMENT_BLOCK()
+        self.__expect_and_move(Kind.DO)
+        node.statement_part = yield self.__STATEMENT_BLOCK()
         return node       
 
     def __parse_REPEAT_STATEMENT(self):
         node = NodeRepeatUntilStatement(None, NodeStatementPart(list()))
-        while not self.__check('UNTIL'):
-            node.statement_part.append(self.__parse_STATEMENT())
-            self.__expect_and_move('SEMICOLON')
+        while not self.__check(Kind.UNTIL):
+            node.statement_part.append((yield self.__parse_STATEMENT()))
+            self.__expect_and_move(Kind.SEMICOLON)
         self.__next_token()
         self.__semantic_module.use_count_score += 1
         node.condition = self.__parse_CONDITION()
         self.__semantic_module.use_count_score -= 1
         return node
-            
+
+    # Compound statements by the kind of their first token
+    STATEMENT_PARSERS = {Kind.IF: __parse_IF_STATEMENT, Kind.CASE: __parse_CASE_STATEMENT,
+                         Kind.FOR: __parse_FOR_STATEMENT, Kind.WHILE: __parse_WHILE_STATEMENT,
+                         Kind.REPEAT: __parse_REPEAT_STATEMENT}
+
+# Body of the subroutine `scope` at token `index` against the first `scope_length` entries
+# of `table`. Returns its declaration and statement parts and the entries it declared
+def _parse_body(table, tokens, index, scope_length, scope):
+    table.set_visible(scope_length)
+    semantic_module = table.semantic_module
+    semantic_module.use_count_score = 0
+    parser = Parser(tokens=tokens)
+    parser.set_semantic_module(semantic_module)
+    try:
+        declaration_part, statement_part = parser.parse_subroutine_body(index, scope)
+    finally:
+        declared = list(islice(reversed(table.items()), len(table) - scope_length))[::-1]
+        semantic_module.remove_from_scope_table(name for name, _ in declared)
+        # the references of a body are added where its nodes go, see __parse_LAZY_BODY
+        semantic_module.clear_references()
+    return declaration_part, statement_part, declared
+
+# Worker process side of Parser.set_jobs. Every worker gets the tokens and the scope table
+# entries once, a job only sees the entries declared before its subroutine body
+def _start_body_worker(tokens, entries):
+    global _body_tokens, _body_positions, _body_table
+    _body_tokens = tokens
+    _body_positions = {id(variable): position for position, (_, variable) in enumerate(entries)}
+    _body_table = BodyScopeTable(entries, tokens.symbols)
+
+def _parse_body_job(job):
+    table = _body_table
+    try:
+        declaration_part, statement_part, declared = _parse_body(table, _body_tokens, *job)
+    finally:
+        changed, shared = take_use_counts(table, _body_positions)
+    return dump_body_result((declaration_part, statement_part, declared), changed, shared, _body_positions)
+
 if __name__ == '__main__':
     lexer = Lexer(file_path= 'test/test pascal file.pas')
     parser = Parser(lexer)
@@ -468,6 +977,6 @@ if __name__ == '__main__':
     parser.set_semantic_module(semantic_module)
     res = parser.parse()
     writer = open('output/parser.txt', 'w')
-    writer.write(str(res))
+    res.write_dump(writer)
     writer.flush()
     writer.close()
\ No newline at end of file
@@ -0,0 +1,286 @@
+from other.SupportClasses import *
+from other.Visitor import Visitor, dispatcher
+from SemanticModule import SemanticModule, SyntaxOnlyModule, TypeVariable
+from other.BodyWorkers import BodyScopeTable, take_use_counts, dump_body_result, load_body_result
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import os
+
+# Semantic checks of a finished NodeProgram parsed with a SyntaxOnlyModule (see Parser.set_semantic_module).
+# The checks and the use counts are those of a Parser with a SemanticModule, made in the same order:
+# the declarations of the program are collected first, then the bodies of the global subroutines
+# are checked, in `jobs` processes if set_jobs asks for more than one, then the main block.
+# The first error in the source is raised. The tree gets the annotations, the types and the
+# references the Parser gives it, the bodies checked by other processes as well
+class SemanticAnalyzer(Visitor):
+    def __init__(self, semantic_module : SemanticModule = None):
+        self.__semantic_module = SemanticModule() if semantic_module is None else semantic_module
+        self.__jobs = 1
+        self.__scope = None
+        # pending nodes and steps of the walk, see __check_tree
+        self.__stack = list()
+        # operands of unary plus, see SyntaxOnlyModule
+        self.__unary_plus = dict()
+        # array types whose bounds are checked, the variables declared together share one
+        self.__array_types = set()
+        # (node, scope table length, scope) of the bodies left for the worker processes
+        self.__deferred_bodies = None
+
+    def get_semantic_module(self):
+        return self.__semantic_module
+
+    # Check the bodies of global subroutines in `jobs` processes, all cores by default.
+    # 1 checks everything in this process
+    def set_jobs(self, jobs = None):
+        self.__jobs = jobs or os.cpu_count()
+
+    # Check `program`, the declarations are added to the scope table of the semantic module.
+    # `syntax_module` is the one the program was parsed with, for its symbol table and unary pluses
+    def analyze(self, program, syntax_module : SyntaxOnlyModule = None):
+        if not isinstance(program, NodeProgram):
+            return program
+        module = self.__semantic_module
+        if syntax_module is not None:
+            module.set_symbol_table(syntax_module.get_symbol_table())
+            self.__unary_plus = syntax_module.unary_plus
+        self.__scope = module.get_scope()
+        self.__deferred_bodies = list() if self.__jobs > 1 else None
+        try:
+            self.__check_tree(program.global_declaration)
+        except Exception:
+            # a deferred body before the failed declaration holds the first error
+            self.__check_DEFERRED_BODIES()
+            raise
+        self.__check_DEFERRED_BODIES()
+        self.__scope = module.get_scope((program.identifier,), self.__scope)
+        self.__check_tree(program.statement_part)
+        module.set_indexed_tree(program)
+        return program
+
+    # Body of the subroutine `scope` (a path of identifiers), as checked by a worker process
+    def check_body(self, declaration_part, statement_part, scope, unary_plus):
+        self.__unary_plus = unary_plus
+        self.__scope = self.__semantic_module.get_scope(scope)
+        self.__check_tree(declaration_part)
+        self.__check_tree(statement_part)
+
+    # Declarations and statements nest without recursion: the handlers push the nodes and
+    # the steps (callables) to take after them, they are taken from the stack in order
+    def __check_tree(self, node):
+        stack = self.__stack = [node]
+        while stack:
+            item = stack.pop()
+            if callable(item):
+                item()
+            else:
+                self.check(item)
+
+    def __push(self, *items):
+        self.__stack.extend(reversed(items))
+
+    def __set_scope(self, scope):
+        self.__scope = scope
+
+    # Declarations and statements, handlers are check_<node class>
+    check = dispatcher('check_')
+
+    def check_NodeDeclarationPart(self, node):
+        self.__push(*node.declaration_list)
+
+    def check_NodeVariableDeclaration(self, node):
+        _type = self.__resolve_type(node.type)
+        node.symbol = self.__semantic_module.add_variable(self.__scope, node.identifier, _type)
+        self.__semantic_module.add_reference(node)
+
+    def check_NodeConstantDeclaration(self, node):
+        self.__check_expression(node.expression, 0)
+        _type = self.__semantic_module.predict_condition_type(node.expression, self.__scope)
+        node.symbol = self.__semantic_module.add_variable(self.__scope, node.identifier, _type, True)
+        self.__semantic_module.add_reference(node)
+        node.type = _type if isinstance(_type, NodeArrayType) else str(_type)
+
+    def check_NodeTypeDeclaration(self, node):
+        _type = self.__resolve_type(node.type)
+        node.symbol = self.__semantic_module.add_type(self.__scope, node.identifier, _type)
+        self.__semantic_module.add_reference(node)
+        if isinstance(node.type, NodeArrayType):
+            node.type.type = str(node.type.type)
+
+    def check_NodeSubroutine(self, node):
+        module = self.__semantic_module
+        parent = self.__scope
+        self.__scope = module.get_scope((node.identifier,), parent)
+        for param in node.formal_params.params:
+            self.check_NodeVariableDeclaration(param)
+        _type = self.__resolve_type(node.type)
+        node.symbol = module.add_subroutine(parent, node.identifier, _type, node.formal_params)
+        module.add_reference(node)
+        if node.is_forward_declaration:
+            self.__scope = parent
+        elif self.__deferred_bodies is not None and parent.parent is None:
+            self.__deferred_bodies.append((node, len(module.get_scope_table()), (node.identifier,)))
+            self.__scope = parent
+        else:
+            self.__push(node.declaration_part, node.statement_part, partial(self.__set_scope, parent))
+
+    # Type of a declaration as the Parser gives it to the semantic module: primitive types by
+    # their names, the other names looked up. The element type of an array is replaced by the
+    # found one, the bounds of an array are checked once
+    def __resolve_type(self, _type):
+        if isinstance(_type, NodeArrayType):
+            if _type not in self.__array_types:
+                self.__array_types.add(_type)
+                for array_range in _type.array_ranges:
+                    self.__check_expression(array_range.left_bound, 0)
+                    self.__check_expression(array_range.right_bound, 0)
+            _type.type = self.__resolve_type(_type.type)
+            return _type
+        if isinstance(_type, (NodeType, TypeVariable)):
+            _type = str(_type)
+        if PrimitiveType.__contains__(_type):
+            return PrimitiveType(_type)
+        return self.__semantic_module.get_type(self.__scope, _type)
+
+    def check_NodeStatementPart(self, node):
+        self.__push(*node.statements)
+
+    def check_NodeIfStatement(self, node):
+        self.__check_expression(node.condition, 1)
+        self.__push(node.then_statement_part, node.else_statement_part)
+
+    # The Parser appends the case block before `else` once more after it, the default block
+    # is checked there
+    def check_NodeSwitchStatement(self, node):
+        blocks = list()
+        default_block = getattr(node, 'default_block', None)
+        for case_block in node.case_blocks:
+            if not blocks or case_block is not blocks[-1]:
+                blocks.append(case_block)
+            elif default_block is not None:
+                blocks.append(default_block)
+                default_block = None
+        if default_block is not None:
+            blocks.append(default_block)
+        self.__push(*blocks)
+
+    def check_NodeCaseBlock(self, node):
+        for case in node.case_list:
+            self.__check_expression(case, 0)
+        self.__push(node.statement_part)
+
+    def check_NodeForStatement(self, node):
+        module = self.__semantic_module
+        variable = node.variable
+        module.use_count_score = 1
+        variable.symbol = module.get_variable(self.__scope, variable.identifier)
+        module.add_reference(variable)
+        if node.initial_expression is not None:
+            self.__check_expression(node.initial_expression, 1)
+            module.use_count_score = 1
+            module.check_assign(self.__scope, variable.identifier, node.initial_expression)
+        self.__check_expression(node.end_expression, 1)
+        module.use_count_score = 0
+        self.__push(node.statement_part)
+
+    def check_NodeWhileStatement(self, node):
+        self.__check_expression(node.condition, 1)
+        self.__push(node.statement_part)
+
+    def check_NodeRepeatUntilStatement(self, node):
+        self.__push(node.statement_part, partial(self.__check_expression, node.condition, 1))
+
+    # Assignments and calls
+    def check_Node(self, node):
+        self.__check_expression(node, 0)
+
+    # Checks of an expression in the order the Parser makes them, operands first. The uses of
+    # variables count when `score` is not 0: as in the Parser it goes up by one for the value
+    # of an assignment and by two for call parameters and array indices
+    def __check_expression(self, node, score):
+        module = self.__semantic_module
+        scope = self.__scope
+        unary_plus = self.__unary_plus
+        stack = [(node, score, False)]
+        while stack:
+            node, score, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, score, True))
+                if isinstance(node, NodeBinaryOperator):
+                    operator = node.operation_type
+                    if operator in SemanticModule.CALL_OPERATORS:
+                        stack.extend((param, score + 2, False) for param in reversed(node.right.params))
+                    else:
+                        stack.append((node.right, score + 1 if operator == Operator.ASSIGN else score, False))
+                    stack.append((node.left, score, False))
+                elif isinstance(node, NodeUnaryOperator):
+                    stack.append((node.left, score, False))
+                continue
+            module.use_count_score = score
+            if isinstance(node, NodeVariable):
+                node.symbol = module.get_variable(scope, node.identifier)
+                module.add_reference(node)
+            elif isinstance(node, NodeBinaryOperator):
+                match node.operation_type:
+                    case Operator.ASSIGN:
+                        variable = node.left
+                        while not isinstance(variable, NodeVariable):
+                            variable = variable.left
+                        module.check_assign(scope, variable.identifier, node.right)
+                    case Operator.SUBROUTINE_CALL:
+                        module.check_subroutine_call(scope, node.left.identifier, node.right)
+                    case Operator.ARRAY_CALL:
+                        module.check_array_access(scope, node.left.identifier, node.right)
+            for _ in range(unary_plus.get(node, 0)):
+                module.check_type_operation_support(node, Operator.UNARY_PLUS, scope)
+        module.use_count_score = 0
+
+    # Check the deferred bodies in a process pool and stitch them in declaration order:
+    # their nodes, the scope table entries they declared and the use counts they changed
+    def __check_DEFERRED_BODIES(self):
+        deferred, self.__deferred_bodies = self.__deferred_bodies, None
+        if not deferred:
+            return
+        module = self.__semantic_module
+        entries = list(module.get_scope_table().items())
+        jobs = [(node.declaration_part, node.statement_part, scope, scope_length, self.__unary_plus_of(node))
+                for node, scope_length, scope in deferred]
+        chunksize = max(1, len(jobs) // (self.__jobs * 4))
+        insertions = list()
+        with ProcessPoolExecutor(self.__jobs, initializer=_start_analysis_worker,
+                                 initargs=(module.get_symbol_table(), entries)) as executor:
+            # results come in declaration order, the first failed body raises its error here
+            for (node, scope_length, _), result in zip(deferred, executor.map(_check_body_job, jobs, chunksize=chunksize)):
+                node.declaration_part, node.statement_part, declared = load_body_result(result, entries, module)
+                insertions.append((scope_length, declared))
+        module.insert_to_scope_table(insertions)
+
+    # Unary pluses of a body, sent together with its nodes
+    def __unary_plus_of(self, node):
+        if not self.__unary_plus:
+            return dict()
+        nodes = (*self.walk(node.declaration_part), *self.walk(node.statement_part))
+        return {operand: self.__unary_plus[operand] for operand in nodes if operand in self.__unary_plus}
+
+# Worker process side of SemanticAnalyzer.set_jobs. Every worker gets the symbol table and
+# the scope table entries once, a job only sees the entries declared before its subroutine body
+def _start_analysis_worker(symbols, entries):
+    global _analysis_positions, _analysis_table
+    _analysis_positions = {id(variable): position for position, (_, variable) in enumerate(entries)}
+    _analysis_table = BodyScopeTable(entries, symbols)
+
+def _check_body_job(job):
+    declaration_part, statement_part, scope, scope_length, unary_plus = job
+    table = _analysis_table
+    table.set_visible(scope_length)
+    semantic_module = table.semantic_module
+    try:
+        SemanticAnalyzer(semantic_module).check_body(declaration_part, statement_part, scope, unary_plus)
+    finally:
+        declared = list(islice(reversed(table.items()), len(table) - scope_length))[::-1]
+        semantic_module.remove_from_scope_table(name for name, _ in declared)
+        # the references point to this worker's copies of the nodes, the main process
+        # adds them again for the nodes it gets back
+        semantic_module.clear_references()
+        changed, shared = take_use_counts(table, _analysis_positions)
+    return dump_body_result((declaration_part, statement_part, declared), changed, shared, _analysis_positions)
@@ -3,6 +3,8 @@ from other.SupportClasses import NodeType
 from other.SupportClasses import NodeVariable, NodeSubroutine, NodeCallParams, NodeArrayType, NodeValue
 from other.SupportClasses import NodeBinaryOperator, NodeUnaryOperator
 import other.SemanticTools as semantic_tools
+from other.Visitor import Visitor, ExpressionVisitor
+from lexer import SymbolTable
 
 from enum import Enum
 
@@ -35,10 +37,56 @@ class SubroutineVariable(Variable):
         self.formal_params = formal_params
         self.use_count = 2**32 - 1
 
-class SemanticModule:
+# Scope of the program or of a subroutine: the identifiers declared in it and the enclosing scope.
+# Scopes are made once per subroutine, an identifier is looked up through the parent links.
+# Identifiers and subroutines are keyed by their symbol ids, see SemanticModule.get_symbol
+class Scope:
+    def __init__(self, name = None, parent = None):
+        self.name = name
+        self.parent = parent
+        self.symbols = dict()
+        self.children = dict()
+        # start of the scope table keys of the identifiers declared here, see convert_to_name
+        self.prefix = f'{parent.prefix}{name}.' if parent is not None else ''
+
+    def child(self, symbol, name):
+        scope = self.children.get(symbol)
+        if scope is None:
+            scope = self.children[symbol] = Scope(name, self)
+        return scope
+
+# Types of the nodes of an expression for Visitor.evaluate: kept in the value_type annotation
+# of the nodes that have one (see Node.ANNOTATIONS), in the dict itself for the others
+class _NodeTypes(dict):
+    def __contains__(self, node):
+        return getattr(node, 'value_type', None) is not None or dict.__contains__(self, node)
+
+    def __getitem__(self, node):
+        value_type = getattr(node, 'value_type', None)
+        return value_type if value_type is not None else dict.__getitem__(self, node)
+
+    def __setitem__(self, node, value_type):
+        try:
+            node.value_type = value_type
+        except AttributeError:
+            dict.__setitem__(self, node, value_type)
+
+# Walker over every node of a tree, the semantic module itself only walks expression operands
+_tree = Visitor()
+
+class SemanticModule(ExpressionVisitor):
+    # Operators whose value is the one of their left operand
+    CALL_OPERATORS = (Operator.SUBROUTINE_CALL, Operator.ARRAY_CALL)
 
     def __init__(self):
         self.__scope_table = dict()
+        self.__global_scope = Scope()
+        self.__symbols = SymbolTable()
+        self.__use_counts = None
+        # declared object -> {node naming it: number of places in the tree}, see add_reference
+        self.__references = dict()
+        # program whose nodes the reference index holds, see set_indexed_tree
+        self.__indexed_tree = None
         self.use_count_score = 0
 
     def __raise_exception(self, message):
@@ -48,33 +96,77 @@ class SemanticModule:
     def convert_to_name(self, scope, identifier):
         return f'{".".join(scope)}.{identifier}' if len(scope) != 0 else identifier
 
-    # Add variable or Type to scope
+    # Identify identifiers by the ids of `symbols` from now on, the Parser gives the table
+    # of its TokenStream. The scopes are made again if the table changes
+    def set_symbol_table(self, symbols : SymbolTable):
+        if symbols is self.__symbols:
+            return
+        self.__symbols = symbols
+        self.__global_scope = Scope()
+        self.__add_to_scopes(self.__scope_table.items())
+
+    def get_symbol_table(self):
+        return self.__symbols
+
+    # Symbol id of an identifier. Case does not matter, `Foo` and `foo` are one symbol
+    def get_symbol(self, identifier):
+        return self.__symbols.symbol(identifier)
+
+    # Scope of the subroutine path `names` (a list of identifiers, the program scope if empty)
+    # inside `parent`, the program scope by default.
+    # Methods taking a scope accept either a Scope or such a path
+    def get_scope(self, names = (), parent = None):
+        if isinstance(names, Scope):
+            return names
+        scope = parent if parent is not None else self.__global_scope
+        for name in names or ():
+            scope = scope.child(self.get_symbol(name), name)
+        return scope
+
+    # Add variable or Type to scope. The table key is made of the spellings of the declarations
     def __add_to_scope(self, scope, identifier, variable : Variable):
-        full_name = self.convert_to_name(scope, identifier)
-        if full_name in self.__scope_table:
-            self.__raise_exception(f'Try to redefine identifier {name} is same scope .{".".join(scope)}')
+        scope = self.get_scope(scope)
+        symbol = self.get_symbol(identifier)
+        if symbol in scope.symbols:
+            self.__raise_exception(f'Try to redefine identifier {name} is same scope .{scope.prefix}')
         type_iter = variable.type
         while isinstance(type_iter, TypeVariable):
             type_iter.use_count += 1
             type_iter = type_iter.type
-        self.__scope_table[full_name] = variable
+        scope.symbols[symbol] = variable
+        self.__scope_table[scope.prefix + identifier] = variable
 
     def __get_object(self, scope, identifier, prefered_object = None):
-        local_scope = scope.copy()
-        scope_len_counter = len(scope)
-        while scope_len_counter >= 0:
-            full_name = self.convert_to_name(local_scope, identifier)
-            if full_name in self.__scope_table:
-                object = self.__scope_table[full_name]
+        scope = self.get_scope(scope)
+        symbol = self.get_symbol(identifier)
+        while scope is not None:
+            object = scope.symbols.get(symbol)
+            if object is not None:
+                if self.__use_counts is not None:
+                    self.__remember_use_counts(object)
                 if (prefered_object is None) or (isinstance(object, prefered_object)):
                     if self.use_count_score and not isinstance(object, TypeVariable): 
                         object.use_count += 1
                     return object
-            if len(local_scope) > 0:
-                local_scope.pop()
-            scope_len_counter -= 1
+            scope = scope.parent
         self.__raise_exception(f'Identifier {identifier} doesn\'t declared')
 
+    # Count a use of an object found before, as __get_object does
+    def __use_object(self, object):
+        if self.__use_counts is not None:
+            self.__remember_use_counts(object)
+        if self.use_count_score and not isinstance(object, TypeVariable):
+            object.use_count += 1
+        return object
+
+    # Keep the use counts of an entry read from a table with `use_counts` (see Parser) before
+    # they change. Declaring a variable of a named type counts a use of every type in the chain
+    def __remember_use_counts(self, variable):
+        use_counts = self.__use_counts
+        while isinstance(variable, Variable) and id(variable) not in use_counts:
+            use_counts[id(variable)] = (variable, variable.use_count)
+            variable = variable.type
+
     def get_type(self, scope, type_name):
         return self.__get_object(scope, type_name, TypeVariable)
 
@@ -87,23 +179,131 @@ class SemanticModule:
     def return_value_type(self, value):
         return semantic_tools.get_value_type(value)
 
+    # add_* return the declared object, the Parser keeps it in the `symbol` of the declaration
     def add_variable(self, scope, identifier, _type, constant = False):
         variable = Variable(identifier, _type, constant)
         self.__add_to_scope(scope, identifier, variable)
+        return variable
 
     def add_type(self, scope, identifier, original_type : NodeType):
         variable = TypeVariable(identifier, original_type)
         self.__add_to_scope(scope, identifier, variable)
+        return variable
 
     def add_subroutine(self, scope, identifier, _type, formal_params):
         variable = SubroutineVariable(identifier, _type, formal_params)
         self.__add_to_scope(scope, identifier, variable)
+        return variable
 
     def get_scope_table(self):
         # not_used = filter(lambda pair: pair[1].state != UseStateEnum.USED, self.__scope_table.items())
         # return list(pair[0] for pair in not_used)
         return self.__scope_table
 
+    # Use `scope_table` (full name -> Variable) from now on, the scopes are filled from it.
+    # The Scope objects stay the same, only their identifiers change
+    def set_scope_table(self, scope_table):
+        self.__scope_table = scope_table
+        self.__use_counts = getattr(scope_table, 'use_counts', None)
+        scopes = [self.__global_scope]
+        while scopes:
+            scope = scopes.pop()
+            scope.symbols.clear()
+            scopes.extend(scope.children.values())
+        self.__add_to_scopes(scope_table.items())
+
+    # Add entries (full name, Variable) to the table and to their scopes as they are
+    def update_scope_table(self, entries):
+        entries = list(entries)
+        self.__scope_table.update(entries)
+        self.__add_to_scopes(entries)
+
+    def remove_from_scope_table(self, names):
+        for full_name in names:
+            del self.__scope_table[full_name]
+            *path, identifier = full_name.split('.')
+            del self.get_scope(path).symbols[self.get_symbol(identifier)]
+
+    def __add_to_scopes(self, entries):
+        for full_name, variable in entries:
+            *path, identifier = full_name.split('.')
+            self.get_scope(path).symbols[self.get_symbol(identifier)] = variable
+
+    # Put back entries declared apart from the table, e.g. by a subroutine body parsed in
+    # another process. `insertions` are (position, entries) pairs ordered by position
+    def insert_to_scope_table(self, insertions):
+        items = list(self.__scope_table.items())
+        scope_table = dict()
+        last = 0
+        for position, entries in insertions:
+            scope_table.update(items[last:position])
+            scope_table.update(entries)
+            self.__add_to_scopes(entries)
+            last = position
+        scope_table.update(items[last:])
+        self.__scope_table = scope_table
+
+    # Reference index: the nodes naming every declared object, its declarations and the variables
+    # using it, in the order they were added. A node is added by the object in its symbol (see
+    # Node.ANNOTATIONS) when it is put in the tree, a node in several places of the tree (see
+    # NodeFactory) is kept once. Passes that drop nodes from the tree remove their references
+    def add_reference(self, node):
+        variable = getattr(node, 'symbol', None)
+        if variable is None:
+            return
+        references = self.__references.get(variable)
+        if references is None:
+            references = self.__references[variable] = dict()
+        references[node] = references.get(node, 0) + 1
+
+    # Add or remove the references of every node of a subtree
+    def add_references(self, node):
+        for child in _tree.walk(node):
+            self.add_reference(child)
+
+    def remove_references(self, node):
+        for child in _tree.walk(node):
+            variable = getattr(child, 'symbol', None)
+            references = self.__references.get(variable) if variable is not None else None
+            if references is None or child not in references:
+                continue
+            if references[child] > 1:
+                references[child] -= 1
+            else:
+                del references[child]
+
+    def clear_references(self):
+        self.__references = dict()
+        self.__indexed_tree = None
+
+    # The program whose every node was added to the index, set by the pass that added them
+    # (the Parser or SemanticAnalyzer). Other trees, e.g. a copy read by NodeSerializer or
+    # the view of an arena, have nodes the index does not know
+    def set_indexed_tree(self, program):
+        self.__indexed_tree = program
+
+    def is_indexed_tree(self, program):
+        return program is not None and program is self.__indexed_tree
+
+    def get_references(self, variable):
+        return list(self.__references.get(variable, ()))
+
+    # Object `identifier` names in `scope`, the use is not counted
+    def find_object(self, scope, identifier):
+        scope = self.get_scope(scope)
+        symbol = self.get_symbol(identifier)
+        while scope is not None:
+            variable = scope.symbols.get(symbol)
+            if variable is not None:
+                return variable
+            scope = scope.parent
+        self.__raise_exception(f'Identifier {identifier} doesn\'t declared')
+
+    # Variable nodes using the object `identifier` names in `scope`, the uses are not counted
+    def find_usages(self, scope, identifier):
+        variable = self.find_object(scope, identifier)
+        return [node for node in self.get_references(variable) if isinstance(node, NodeVariable)]
+
     def check_type_operation_support(self, condition, oper : Operator, scope = None):
         if PrimitiveType.__contains__(condition):
             predict_type = condition
@@ -165,11 +365,11 @@ class SemanticModule:
         if not isinstance(type_1, PrimitiveType) and not isinstance(type_2, PrimitiveType):
             result = type_1 == type_2
         elif isinstance(type_1, NodeArrayType):
-            result = (type_1.type, type_2) in semantic_tools.assign_support
+            result = semantic_tools.is_assign_supported(type_1.type, type_2)
         elif isinstance(type_2, NodeArrayType):
-            result = (type_2.type, type_1) in semantic_tools.assign_support
+            result = semantic_tools.is_assign_supported(type_2.type, type_1)
         else:
-            result = (type_1, type_2) in semantic_tools.assign_support
+            result = semantic_tools.is_assign_supported(type_1, type_2)
         return result
 
     def check_assign(self, scope, variable_name, condition):
@@ -189,72 +389,90 @@ class SemanticModule:
             type = type.type
         return type
 
+    # Type of an expression, computed bottom-up once per node: the type of an operator or a
+    # variable is kept in its value_type, and a variable keeps the object it names in its symbol
+    # (the Parser sets it when the variable is read). Later calls, the optimizer and Gen read them
     def predict_condition_type(self, condition, scope = None):
         if 'type' in condition.__dict__:
             return condition.type
-        order_result = self.__post_order_condition(condition, scope)
-        predict_type = self.__convolute_type_operator_vector(order_result)
-        return predict_type
+        return self.evaluate(condition, _NodeTypes(), scope)
 
     def convert_to_bool(self, value):
         return semantic_tools.conver_value_to_boolean(value)
 
-    def __post_order_condition(self, top, scope = None):
-        stack = [top]
-        visited = []
-        result = []
-        while len(stack) > 0:
-            top = stack.pop()
-            if isinstance(top, NodeBinaryOperator):
-                if top.left not in visited and top.right not in visited:
-                    stack.append(top)
-                    stack.append(top.right)
-                    stack.append(top.left)
-                else:
-                    visited.append(top)
-                    if top.operation_type in Operator.get_value_operators():
-                        result.append(top.operation_type)
-            elif isinstance(top, NodeUnaryOperator):
-                if top.left not in visited:
-                    stack.append(top)
-                    stack.append(top.left)
-                else:
-                    visited.append(top)
-                    result.append(top.operation_type)
-            else:
-                visited.append(top)
-                if isinstance(top, NodeVariable):
-                    variable = self.__get_object(scope, top.identifier)
-                    result.append(self.__get_primitive_type(variable.type))
-                else:
-                    if 'type' in top.__dict__:
-                        result.append(self.__get_primitive_type(top.type))
-        return result
+    def visit_NodeBinaryOperator(self, node, types, scope):
+        operator = node.operation_type
+        if operator in SemanticModule.CALL_OPERATORS:
+            return types[node.left]
+        left, right = types[node.left], types[node.right]
+        self.check_type_operation_support(left, operator)
+        self.check_type_operation_support(right, operator)
+        return semantic_tools.cast_types_by_operator(left, right, operator)
+
+    def visit_NodeUnaryOperator(self, node, types, scope):
+        operator = node.operation_type
+        left = types[node.left]
+        self.check_type_operation_support(left, operator)
+        return semantic_tools.cast_types_by_operator(left, None, operator)
+
+    def visit_NodeVariable(self, node, types, scope):
+        variable = getattr(node, 'symbol', None)
+        if variable is None:
+            variable = node.symbol = self.__get_object(scope, node.identifier)
+        else:
+            self.__use_object(variable)
+        return self.__get_primitive_type(variable.type)
+
+    # Call parameters are checked by check_subroutine_call and check_array_access
+    def visit_NodeCallParams(self, node, types, scope):
+        return None
+
+    def visit_object(self, node, types, scope):
+        if 'type' not in node.__dict__:
+            self.__raise_exception(f'Can not predict type of {node.__class__.__name__}')
+        return self.__get_primitive_type(node.type)
+
+# Semantic module of a parse that only builds the tree, the checks are left to SemanticAnalyzer.
+# The scopes are kept for the Parser, nothing is declared or looked up: a named type is a NodeType
+# with its name, a constant gets the UNDEFINED type. Literals are still checked, as the Parser
+# folds unary operators into them. Unary plus leaves no node, so its other operands are
+# remembered in unary_plus (node -> how many times) for the analyzer
+class SyntaxOnlyModule(SemanticModule):
+    def __init__(self):
+        super().__init__()
+        self.unary_plus = dict()
+
+    def get_type(self, scope, type_name):
+        return NodeType(type_name)
+
+    def get_variable(self, scope, variable_name):
+        return None
+
+    def add_variable(self, scope, identifier, _type, constant = False):
+        return None
+
+    def add_type(self, scope, identifier, original_type):
+        return None
 
-    def __convolute_type_operator_vector(self, post_order_result):
-        while len(post_order_result) != 1:
-            index = 0
-            while len(post_order_result) > index:
-                if isinstance(post_order_result[index], Operator):
-                    index += 1  
-                else:
-                    first = post_order_result[index]
-                    if post_order_result[index + 1] == Operator.UNARY_MINUS or post_order_result[index + 1] == Operator.UNARY_PLUS:
-                        operator = post_order_result[index + 1]
-                        self.check_type_operation_support(first, operator)
-                        post_order_result[0] = semantic_tools.cast_types_by_operator(first, None, operator)
-                        post_order_result.pop(1)
-                        index += 2
-                    else:
-                        second = post_order_result[index + 1]
-                        operator = post_order_result[index + 2]
-                        self.check_type_operation_support(first, operator)
-                        self.check_type_operation_support(second, operator)
-                        post_order_result[0] = semantic_tools.cast_types_by_operator(first, second, operator)
-                        post_order_result.pop(1)
-                        post_order_result.pop(1)
-                        index += 3
-        return post_order_result[0]
+    def add_subroutine(self, scope, identifier, _type, formal_params):
+        return None
+
+    def check_type_operation_support(self, condition, oper : Operator, scope = None):
+        if scope is None or isinstance(condition, NodeValue):
+            return super().check_type_operation_support(condition, oper, scope)
+        self.unary_plus[condition] = self.unary_plus.get(condition, 0) + 1
+
+    def check_subroutine_call(self, scope, subroutine_name, input_params):
+        return True
+
+    def check_array_access(self, scope, variable_name, params):
+        return True
+
+    def check_assign(self, scope, variable_name, condition):
+        return True
+
+    def predict_condition_type(self, condition, scope = None):
+        return PrimitiveType.UNDEFINED
 
 if __name__ == '__main__':
     t1 = NodeValue('254', PrimitiveType.BYTE)
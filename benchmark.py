@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+import tracemalloc
+
+from lexer import Lexer, find_edit
+from Parser import Parser
+from SemanticModule import SemanticModule, SyntaxOnlyModule
+from SemanticAnalyzer import SemanticAnalyzer
+from other.NodeArena import NodeArena
+from other.NodeSerializer import dumps, loads
+from other.NodeFactory import NodeFactory
+
+# Generates a big machine-like Pascal program with `count` procedures
+def generate_program(count = 1000):
+    lines = ['PROGRAM Generated;', 'VAR', '  g1, g2, g3: integer;', '  gr: real;']
+    for index in range(count):
+        lines += [f'PROCEDURE p{index}(x: integer; y: integer);',
+                  'VAR t: integer;',
+                  'begin',
+                  '  t := x * 2 + y;',
+                  '  if t > 10 then',
+                  '  begin',
+                  '    g1 := g1 + t;',
+                  '    y := y - 1;',
+                  '  end',
+                  '  else',
+                  '    g2 := g2 + 1;',
+                  '  while y > 0 do',
+                  '    y := y - 1;',
+                  '  for t := 1 to 10 do',
+                  '    g3 := g3 + t;',
+                  '  gr := x / 3.5;',
+                  'end;']
+    lines += ['begin', '  g1 := 0;', '  g2 := 1;']
+    lines += [f'  p{index}(g1, g2);' for index in range(count)]
+    lines.append('end.')
+    return '\n'.join(lines)
+
+# Long generated arithmetic in loop conditions, `length` operands per condition
+def generate_expressions(count = 200, length = 60):
+    lines = ['PROGRAM Expressions;', 'VAR', '  a, b, c: integer;', 'begin', '  a := 1;', '  b := 2;']
+    operands = ['a * 2', '(b - 1)', '-c', 'a div 3', '(a + b) * (c - 1)', '7 mod b']
+    for index in range(count):
+        chain = ' + '.join(operands[(index + term) % len(operands)] for term in range(length))
+        lines += [f'  while {chain} > {index} do', '    b := b + 1;']
+    lines.append('end.')
+    return '\n'.join(lines)
+
+# `depth` parentheses around a single operand
+def generate_parentheses(depth = 10000):
+    return '\n'.join(['PROGRAM Parentheses;', 'VAR', '  a: integer;', 'begin',
+                      '  while ' + '(' * depth + 'a' + ')' * depth + ' > 0 do', '    a := a - 1;', 'end.'])
+
+# `depth` nested if/while/for statements, most of them with begin blocks
+def generate_nesting(depth = 10000):
+    heads = ['if a > 0 then begin', 'while a > 0 do', 'for a := 1 to 2 do begin', 'while a > 1 do begin']
+    tails = ['end', '', 'end', 'end']
+    lines = ['PROGRAM Nesting;', 'VAR', '  a: integer;', 'begin']
+    lines += [heads[level % 4] for level in range(depth)]
+    lines.append('a := a - 1')
+    lines += [tails[level % 4] for level in reversed(range(depth)) if tails[level % 4]]
+    lines.append('end.')
+    return '\n'.join(lines)
+
+def parse(source, jobs = 1, lazy = False, arena = None, factory = None):
+    parser = Parser(source=source)
+    parser.set_semantic_module(SemanticModule())
+    parser.set_jobs(jobs)
+    parser.set_lazy(lazy)
+    parser.set_arena(arena)
+    parser.set_node_factory(factory)
+    return parser.parse()
+
+def collect_tokens(source, engine):
+    lexer = Lexer(source=source, engine=engine)
+    tokens = []
+    token = lexer.get_next_token()
+    while token[0] != 'EOF':
+        tokens.append(token)
+        token = lexer.get_next_token()
+    tokens.append(token)
+    return tokens
+
+# Best of `repeat` runs, in tokens per second
+def measure_lexer(source, engine, repeat = 5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(collect_tokens(source, engine))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, count / best
+
+# Rough size of the tokens kept in memory, tuples with their values against the span columns
+def tokens_size(tokens):
+    return sum(sys.getsizeof(token) + sys.getsizeof(token[1]) for token in tokens)
+
+def stream_size(stream):
+    columns = (stream.kinds, stream.starts, stream.ends, stream.spelling_ids, stream.values, stream.positions)
+    return sum(sys.getsizeof(column) for column in columns)
+
+def measure_tokenize(source, repeat = 5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stream = Lexer(source=source, engine=Lexer.ENGINE_REGEX).tokenize()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return stream, len(stream) / best
+
+# Median time of re-lexing after a one character edit, against lexing everything again
+def measure_retokenize(source, edits = 100):
+    lexer = Lexer(source=source, engine=Lexer.ENGINE_REGEX)
+    stream = lexer.tokenize()
+    times = []
+    for edit in range(edits):
+        offset = source.index(';', edit * len(source) // edits)
+        edited = source[:offset] + ' ' + source[offset:]
+        start = time.perf_counter()
+        lexer.retokenize(stream, *find_edit(source, edited))
+        times.append(time.perf_counter() - start)
+        source = edited
+    return sorted(times)[len(times) // 2]
+
+def benchmark_lexer(count = 1000):
+    source = generate_program(count)
+    print(f'Lexer, {len(source)} characters')
+    # get_next_token of both engines gives tuples, tokenize() of the regex engine a span stream
+    for engine in (Lexer.ENGINE_LADDER, Lexer.ENGINE_REGEX):
+        tokens, speed = measure_lexer(source, engine)
+        print(f'  {engine:>8} tuples: {tokens} tokens, {speed:,.0f} tokens/sec')
+    stream, speed = measure_tokenize(source)
+    print(f'  {"regex":>8} spans: {len(stream)} tokens, {speed:,.0f} tokens/sec')
+    tuples = tokens_size(collect_tokens(source, Lexer.ENGINE_REGEX))
+    edit = measure_retokenize(source)
+    print(f'  one character edit: {edit * 1000:.2f} ms, full lexing {len(stream) / speed * 1000:.2f} ms')
+    print(f'  memory: tuples {tuples / len(stream):.0f} bytes/token, spans {stream_size(stream) / len(stream):.1f} bytes/token')
+
+# Best of `repeat` runs, in tokens per second
+def measure_parser(source, repeat = 5):
+    tokens = len(Lexer(source=source, engine=Lexer.ENGINE_REGEX).tokenize())
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return tokens, tokens / best
+
+# Best of `repeat` runs, in seconds
+def measure_parse(source, jobs = 1, lazy = False, repeat = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(source, jobs, lazy)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Best of `repeat` runs of the separate semantic checks alone, in seconds
+def measure_analysis(source, jobs = 1, repeat = 3):
+    best = None
+    for _ in range(repeat):
+        syntax_module = SyntaxOnlyModule()
+        parser = Parser(source=source)
+        parser.set_semantic_module(syntax_module)
+        tree = parser.parse()
+        analyzer = SemanticAnalyzer()
+        analyzer.set_jobs(jobs)
+        start = time.perf_counter()
+        analyzer.analyze(tree, syntax_module)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Memory taken by the tree and the scope table after parsing, in MB
+def measure_memory(source, arena = None, factory = None):
+    tracemalloc.start()
+    tree = parse(source, arena=arena, factory=factory)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / 1e6
+
+# Median time of an incremental reparse after a one line edit of a subroutine body
+def measure_reparse(source, edits = 20):
+    lexer = Lexer(source=source, engine=Lexer.ENGINE_REGEX)
+    stream = lexer.tokenize()
+    parser = Parser(tokens=stream)
+    parser.set_semantic_module(SemanticModule())
+    parser.set_incremental()
+    parser.parse()
+    times = []
+    for edit in range(edits):
+        offset = source.index('g2 := g2 + 1', edit * len(source) // (edits + 1))
+        edited = source[:offset] + f'g2 := g2 + {edit + 2}' + source[offset + 12:]
+        lexer.retokenize(stream, *find_edit(source, edited))
+        source = edited
+        start = time.perf_counter()
+        parser.set_tokens(stream)
+        parser.parse()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+def benchmark_parser(count = 200):
+    print('Parser')
+    tokens, speed = measure_parser(generate_expressions(count))
+    print(f'  expressions: {tokens} tokens, {speed:,.0f} tokens/sec')
+    program = generate_program(count * 5)
+    for jobs in sorted({1, os.cpu_count()}):
+        print(f'  {count * 5} subroutines, {jobs} processes: {measure_parse(program, jobs):.2f} s')
+    print(f'  {count * 5} subroutines, lazy bodies: {measure_parse(program, lazy=True):.2f} s')
+    for jobs in sorted({1, os.cpu_count()}):
+        print(f'  {count * 5} subroutines, separate checks in {jobs} processes: {measure_analysis(program, jobs):.2f} s')
+    print(f'  {count * 5} subroutines, one line edit: {measure_reparse(program) * 1000:.2f} ms')
+    arena = NodeArena()
+    parse(program, arena=arena)
+    objects, packed = measure_memory(program), measure_memory(program, NodeArena())
+    print(f'  {count * 5} subroutines, {len(arena)} nodes: objects {objects:.1f} MB, arena {packed:.1f} MB')
+    factory = NodeFactory()
+    parse(program, factory=factory)
+    shared = measure_memory(program, factory=NodeFactory())
+    print(f'  {count * 5} subroutines, shared expressions: {shared:.1f} MB, {objects - shared:.1f} MB saved, '
+          f'{factory.report().splitlines()[-1]}')
+    tree = parse(program)
+    data = dumps(tree)
+    start = time.perf_counter()
+    loads(data)
+    print(f'  {count * 5} subroutines, binary tree: {len(data) / 1e3:.0f} KB, loading {time.perf_counter() - start:.2f} s')
+    start = time.perf_counter()
+    parse(generate_parentheses())
+    print(f'  10000 nested parentheses: {time.perf_counter() - start:.2f} s')
+    start = time.perf_counter()
+    nested = parse(generate_nesting())
+    print(f'  10000 nested statements: {time.perf_counter() - start:.2f} s')
+    with open(os.devnull, 'w') as dump:
+        start = time.perf_counter()
+        tree.write_dump(dump)
+        print(f'  {count * 5} subroutines, tree dump: {time.perf_counter() - start:.2f} s')
+        start = time.perf_counter()
+        nested.write_dump(dump, max_depth=100)
+        print(f'  10000 nested statements, tree dump to depth 100: {time.perf_counter() - start:.2f} s')
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    benchmark_lexer(count)
+    benchmark_parser(count // 5)
@@ -1,5 +1,6 @@
 import other.SupportClasses as s
 import Parser as p
+from other.Visitor import Visitor, dispatcher
 
 type_map = {
     'BYTE' : 'unsigned char',
@@ -14,7 +15,9 @@ type_map = {
     'DOUBLE' : 'double'
 }
 
-class Gen:
+cpp_types = {t: type_map.get(t, "bool" if t == s.PrimitiveType.BOOLEAN else t.lower()) for t in s.PrimitiveType}
+
+class Gen(Visitor):
     l = "   "
     types = []
     code = ""
@@ -39,7 +42,12 @@ class Gen:
 
         return c
 
+    # C++ type of a declaration. Primitive types are taken from the object semantics
+    # declared for it (its symbol), the names of the others are looked up as before
     def type(self, t):
+        symbol = getattr(t, 'symbol', None)
+        if symbol is not None and isinstance(symbol.type, s.PrimitiveType):
+            return cpp_types[symbol.type]
         if t.type in self.types:
             c = t.type
         elif t.type in type_map:
@@ -167,42 +175,43 @@ class Gen:
 
         return c
 
-    def bin_operation(self, b):
-        c = ""
+    # Expressions, handlers are bin_operation_<node class>
+    bin_operation = dispatcher('bin_operation_')
+
+    def bin_operation_NodeVariable(self, b):
+        return f"{b.identifier}"
+
+    def bin_operation_NodeValue(self, b):
+        return self.is_string(b)
+
+    def bin_operation_NodeUnaryOperator(self, b):
+        c = self.unary_condition(b) + "("
+        if b.left is not None:
+            c += self.bin_operation(b.left)
 
-        if isinstance(b, s.NodeUnaryOperator):
-            c += self.unary_condition(b) + "("
+        return c + ")"
 
-        f = isinstance(b, s.NodeVariable) or isinstance(b, s.NodeValue)
-        while not f and b.left is not None:
+    def bin_operation_NodeBinaryOperator(self, b):
+        c = ""
+
+        if b.left is not None:
             c += self.bin_operation(b.left)
-            break
-
-        if isinstance(b, s.NodeVariable):
-            c += f"{b.identifier}"
-        elif isinstance(b, s.NodeValue):
-            c += self.is_string(b)
-        elif isinstance(b, s.NodeBinaryOperator):
-            if b.operation_type == 'ARRAY_CALL':
-                for i in b.right.params:
-                    if isinstance(i, s.NodeValue):
-                        c += f'[{i.value}]'
-                    else:
-                        c += f"[{i.identifier}]"
-            elif b.operation_type == 'SUBROUTINE_CALL':
-                c += "("
-                for i in b.right.params:
-                    c += i.identifier + ", "
-                c = c[:-2] + ")"
-            else:
-                c += self.condition(b)
-
-        if isinstance(b, s.NodeUnaryOperator):
-            c += ")"
+
+        if b.operation_type == 'ARRAY_CALL':
+            for i in b.right.params:
+                if isinstance(i, s.NodeValue):
+                    c += f'[{i.value}]'
+                else:
+                    c += f"[{i.identifier}]"
+        elif b.operation_type == 'SUBROUTINE_CALL':
+            c += "("
+            for i in b.right.params:
+                c += i.identifier + ", "
+            c = c[:-2] + ")"
         else:
-            while not f and b.operation_type != 'ARRAY_CALL' and b.operation_type != 'SUBROUTINE_CALL' and b.right is not None:
+            c += self.condition(b)
+            if b.right is not None:
                 c += self.bin_operation(b.right)
-                break
 
         return c
 
@@ -211,35 +220,37 @@ class Gen:
         sp = sp.statements
 
         for i in sp:
-            if not (isinstance(i, p.NodeBinaryOperator)):
-                for j in range(level):
-                    c += "\n" + self.l
-            else:
-                for j in range(level):
-                    c += self.l
-            if (isinstance(i, p.NodeBinaryOperator)):
-                bin_operation = self.bin_operation(i)
-                c += f"{bin_operation};\n"
-            elif (isinstance(i, s.NodeIfStatement)):
-                if_statement = self.if_statement(i, level)
-                c += f"{if_statement}"
-            elif (isinstance(i, s.NodeSwitchStatement)):
-                switch = self.switch_condition(i, level)
-                c += f"{switch}"
-            elif (isinstance(i, s.NodeWhileStatement)):
-                while_statement = self.while_statement(i, level)
-                c += f"{while_statement}"
-            elif (isinstance(i, s.NodeRepeatUntilStatement)):
-                repeat_statement = self.repeat_statement(i, level)
-                c += f"{repeat_statement}"
-            elif (isinstance(i, s.NodeForStatement)):
-                for_statement = self.for_statement(i, level)
-                c += f"{for_statement}"
+            c += self.statement(i, level)
         for j in range(level-1):
             c += self.l
 
         return c + "}\n"
 
+    # Statements of a statement part, handlers are statement_<node class>
+    statement = dispatcher('statement_')
+
+    # Assignments and calls take one line, the other statements start after an empty one
+    def statement_NodeBinaryOperator(self, i, level):
+        return self.l * level + f"{self.bin_operation(i)};\n"
+
+    def statement_Node(self, i, level):
+        return ("\n" + self.l) * level
+
+    def statement_NodeIfStatement(self, i, level):
+        return self.statement_Node(i, level) + self.if_statement(i, level)
+
+    def statement_NodeSwitchStatement(self, i, level):
+        return self.statement_Node(i, level) + self.switch_condition(i, level)
+
+    def statement_NodeWhileStatement(self, i, level):
+        return self.statement_Node(i, level) + self.while_statement(i, level)
+
+    def statement_NodeRepeatUntilStatement(self, i, level):
+        return self.statement_Node(i, level) + self.repeat_statement(i, level)
+
+    def statement_NodeForStatement(self, i, level):
+        return self.statement_Node(i, level) + self.for_statement(i, level)
+
     def var(self, v, level):
         c = ""
         for i in range(level):
@@ -289,17 +300,28 @@ class Gen:
         c = ""
 
         for i in dp.declaration_list:
-            if isinstance(i, s.NodeConstantDeclaration):
-                c += self.const(i, 0) + ";\n"
-            elif isinstance(i, s.NodeTypeDeclaration):
-                c += self.type_declaration(i) + "\n"
-            elif isinstance(i, s.NodeVariableDeclaration):
-                c += self.var(i, 0) + ";\n"
-            elif isinstance(i, s.NodeSubroutine):
-                c += "\n" + self.subroutine(i) + "\n"
+            c += self.declaration(i)
 
         return c + "\n"
 
+    # Declarations of the program, handlers are declaration_<node class>
+    declaration = dispatcher('declaration_')
+
+    def declaration_Node(self, i):
+        return ""
+
+    def declaration_NodeConstantDeclaration(self, i):
+        return self.const(i, 0) + ";\n"
+
+    def declaration_NodeTypeDeclaration(self, i):
+        return self.type_declaration(i) + "\n"
+
+    def declaration_NodeVariableDeclaration(self, i):
+        return self.var(i, 0) + ";\n"
+
+    def declaration_NodeSubroutine(self, i):
+        return "\n" + self.subroutine(i) + "\n"
+
     def const(self, td, level):
         c = "const " + self.var(td, level)
         return c
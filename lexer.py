@@ -1,18 +1,29 @@
 import sys
+import re
+import locale
+from enum import IntEnum
+from array import array
+from bisect import bisect_left, bisect_right
+from other.SemanticTools import get_number_type
 
 class Lexer:
-    def __init__(self, file_path : str = None):
-        if file_path:
-            self.file = open(file_path, 'r')
-        else:
-            self.file = None
+    # Tokenizer engines: character by character if/elif ladder or one compiled master pattern
+    ENGINE_LADDER = 'ladder'
+    ENGINE_REGEX = 'regex'
+
+    def __init__(self, file_path : str = None, engine : str = ENGINE_LADDER, source = None):
+        self.source = ''
+        self.length = 0
         self.current_pos = 0
         self.current_char = None
         self.row, self.col = 1, 0
-
-    def __del__(self):
-        if self.file:
-            self.file.close()
+        if engine not in (Lexer.ENGINE_LADDER, Lexer.ENGINE_REGEX):
+            raise ValueError(f'Unknown lexer engine {engine}')
+        self.engine = engine
+        if file_path:
+            self.add_file(file_path)
+        elif source is not None:
+            self.add_source(source)
 
     KEYWORDS = {
         'if': 'IF',
@@ -91,30 +102,361 @@ class Lexer:
         '\n': 'NEWLINE'
     }
 
+    # Keywords and types resolved by one lookup
+    RESERVED = {**KEYWORDS, **TYPES}
+
+    # Digits of number literals, other Unicode digits only go inside identifiers
+    DIGITS = frozenset('0123456789')
+
+    # Master pattern of the regex engine, leading whitespace is skipped by the same match.
+    # Every alternative consumes exactly what the ladder engine consumes, including
+    # its quirks: a lone ':' or '.' swallows the next character, a string takes at
+    # most one doubled quote and "1..10" gives the number's last character back.
+    TOKEN_REGEX = re.compile(r'''[ \t\n]*(?:
+          (?P<NAME>[^\W\d]\w*)
+        | (?P<SYMBOL>[=+\-*/)\[\]{},;"])
+        | (?P<NUMBER_RANGE>[0-9]+\.[0-9]*\.)
+        | (?P<INVALID_IDENTIFIER>[0-9]+[^\W\d])
+        | (?P<INVALID_NUMBER>[0-9]+\.(?![0-9]))
+        | (?P<REAL_VAL>[0-9]+\.[0-9]+)
+        | (?P<INTEGER_VAL>[0-9]+)
+        | (?P<ASSIGN>:=)
+        | (?P<COLON>:[\s\S]?)
+        | (?P<RELATION><[=>]?|>[=>]?)
+        | (?P<ARRDOT>\.\.)
+        | (?P<DOT>\.[\s\S]?)
+        | (?P<STRING>'[^']*'(?!')|'[^']*''[^']*')
+        | (?P<COMMENT>\(\*(?=\))|\(\*[^)][^)]*\))
+        | (?P<LPAREN>\((?!\*))
+        | (?P<EOF>\Z)
+        | (?P<ERROR>[\s\S])
+    )''', re.VERBOSE)
+
+    # Token kind codes stored in TokenStream, the names of TokenKind. The last ones are
+    # only known to the parser grammar, the lexer does not produce them.
+    # Number literals are INTEGER_VAL or REAL_VAL, NUMBER is the kind of the `number` keyword
+    TOKEN_KINDS = tuple(dict.fromkeys(['EOF', 'IDENTIFIER', 'NUMBER', 'STRING_VAL', 'CHAR_VAL',
+                                       'INTEGER_VAL', 'REAL_VAL', 'COMMENT',
+                                       *KEYWORDS.values(), *TYPES.values(), *SYMBOLS.values(),
+                                       'NOT', 'OR', 'XOR', 'SHL', 'SHR', 'FORWARD', 'RECORD', 'LCOM']))
+    KIND_CODES = {kind: code for code, kind in enumerate(TOKEN_KINDS)}
+    RESERVED_CODES = dict(zip(RESERVED, map(KIND_CODES.get, RESERVED.values())))
+    SYMBOL_CODES = dict(zip(SYMBOLS, map(KIND_CODES.get, SYMBOLS.values())))
+    # Kinds whose value never depends on the source text
+    FIXED_VALUES = {kind: value for value, kind in SYMBOLS.items()}
+    FIXED_VALUES['EOF'] = 'eof'
+
     def error(self, message):
         print("Lexer error:", message, f"at line {self.row}, index {self.col - 1}")
         sys.exit(1)
 
+    # Load the whole source at once, the lexer then only moves an index over it.
+    # Both engines index a str (row/col and token values count characters, not bytes),
+    # so a memory-mapped file would be decoded in full as well and is not used
     def add_file(self, file_path):
-        if self.file:
-            self.file.close()
-        self.file = open(file_path, 'r')
+        with open(file_path, 'r') as file:
+            self.add_source(file.read())
+
+    # Source given in memory: str, or bytes-like (bytes, bytearray, memoryview, mmap)
+    def add_source(self, source):
+        if not isinstance(source, str):
+            source = str(source, locale.getpreferredencoding(False))
+        # same newline translation as a text mode read
+        if '\r' in source:
+            source = source.replace('\r\n', '\n').replace('\r', '\n')
+        self.source = source
+        self.length = len(source)
+        self.current_pos = 0
+        self.current_char = None
+        self.row, self.col = 1, 0
+        if self.engine == Lexer.ENGINE_REGEX:
+            self.get_next_token = self.__scan_tokens().__next__
 
     def has_next(self):
         return self.current_char != ''
 
     def get_next_char(self):
-        if self.has_next():
-            self.current_char = self.file.read(1)
-        if self.current_char == '\n':
+        char = self.current_char
+        if char != '':
+            pos = self.current_pos
+            if pos < self.length:
+                char = self.current_char = self.source[pos]
+                self.current_pos = pos + 1
+            else:
+                char = self.current_char = ''
+        if char == '\n':
             self.row += 1
             self.col = 0
         else:
             self.col += 1
 
+    # Tokenize the whole source into a span based TokenStream, its identifiers are interned
+    # into `symbols` if given
+    def tokenize(self, symbols = None):
+        stream = TokenStream(self.source, symbols)
+        if self.engine == Lexer.ENGINE_REGEX:
+            self.__scan_spans(stream)
+        else:
+            token = self.get_next_token()
+            while token[0] != 'EOF':
+                stream.append_token(*token)
+                if self.number is not None:
+                    stream.numbers[len(stream) - 1] = self.number
+                token = self.get_next_token()
+            stream.append_token(*token)
+        return stream
+
+    # Apply an edit (`removed` characters at `offset` replaced by `inserted`) to a stream
+    # made by tokenize(), the stream is updated in place. With ENGINE_REGEX only tokens from
+    # the one before the edit up to the first old token boundary the new scan falls back onto
+    # are lexed again. The ladder engine, or a stream with stored positions (tokens added by
+    # append_token), has no span scan to resume, so the whole source is lexed again:
+    # callers that need incremental lexing select ENGINE_REGEX.
+    def retokenize(self, stream, offset, removed, inserted):
+        inserted = inserted.replace('\r\n', '\n').replace('\r', '\n')
+        self.add_source(stream.source[:offset] + inserted + stream.source[offset + removed:])
+        if self.engine != Lexer.ENGINE_REGEX or stream.positions:
+            stream.splice(0, len(stream), self.tokenize(stream.symbols), 0, self.source)
+            return stream
+        # a token depends on its text and the character after it, so the token ending
+        # right before the edit is lexed again too
+        first = max(stream.first_ending_at(offset) - 1, 0)
+        if first > 0 and first - 1 in stream.values:
+            # closing dot of a number range, the scan has to start at the number
+            first -= 1
+        previous_end = stream.span(first - 1)[1] if first > 0 else 0
+        delta = len(inserted) - removed
+        fresh = TokenStream(self.source, stream.symbols)
+        position = stream.span(first)[0] if first > 0 else 0
+        last = self.__scan_spans(fresh, position, previous_end, stream, offset + len(inserted), delta)
+        stream.splice(first, last, fresh, delta, self.source)
+        return stream
+
+    # Regex engine. Every match becomes a (kind, start, end) span and identifiers get their
+    # spelling id (-1 for other tokens). Values are only
+    # stored for the rare tokens that are not a function of their text and (row, col)
+    # is recovered from the span end by TokenStream.position.
+    # A partial scan starts at a token start and stops at the first token from `resync` on
+    # that begins where a token of `old` began, `delta` characters earlier. The index of
+    # that old token is returned.
+    def __scan_spans(self, stream, position = 0, previous_end = 0, old = None, resync = sys.maxsize, delta = 0):
+        source = self.source
+        length = self.length
+        codes = Lexer.KIND_CODES
+        reserved = Lexer.RESERVED_CODES
+        symbols = Lexer.SYMBOL_CODES
+        identifier, integer, real = codes['IDENTIFIER'], codes['INTEGER_VAL'], codes['REAL_VAL']
+        known, spell = stream.symbols.spellings, stream.symbols.spell
+        # flat (kind, start, end, spelling id) records, split into columns at the end
+        spans = []
+        add = spans.extend
+        last = None
+        for match in Lexer.TOKEN_REGEX.finditer(source, position):
+            kind = match.lastgroup
+            start, end = match.span(kind)
+            if start >= resync and kind != 'EOF':
+                index = old.match_start(start - delta)
+                if index >= 0:
+                    last = index
+                    break
+            symbol = -1
+            if kind == 'NAME':
+                name = match.group(kind)
+                if not name.isascii():
+                    offset = self.__bad_name_offset(name)
+                    if offset is not None:
+                        self.__scan_error(f'Unexpected symbol: {name[offset]}', start + offset)
+                key = name.lower()
+                code = reserved.get(key, identifier)
+                if code == identifier:
+                    symbol = known.get(name)
+                    if symbol is None:
+                        symbol = spell(name, key)
+            elif kind == 'SYMBOL':
+                code = symbols[match.group(kind)]
+            elif kind == 'INTEGER_VAL':
+                code = integer
+            elif kind == 'REAL_VAL':
+                code = real
+            elif kind == 'COLON' or kind == 'DOT':
+                code = codes[kind]
+                end = start + 2
+            elif kind == 'RELATION':
+                code = symbols.get(match.group(kind))
+                if code is None:
+                    self.__scan_error(f'Unexpected symbol: {match.group(kind)}', end)
+            elif kind == 'STRING':
+                value = match.group(kind)
+                code = codes['CHAR_VAL' if len(value) == 3 or value == "''''" else 'STRING_VAL']
+            elif kind == 'NUMBER_RANGE':
+                # the number ends one character early and its closing dot reads as '..'
+                end -= 1
+                value = stream.values[len(spans) // 4] = self.__normalize_number(source[start:end])[:-1]
+                add((real if '.' in value else integer, start, end, -1))
+                code, start, end = codes['ARRDOT'], end, end + 1
+            elif kind == 'EOF':
+                break
+            elif kind == 'INVALID_IDENTIFIER':
+                if not (source[end - 1].isalpha() or source[end - 1] == '_'):
+                    self.__scan_error(f'Unexpected symbol: {source[end - 1]}', end - 1)
+                self.__scan_error(f'Invalid identifier', end - 1)
+            elif kind == 'INVALID_NUMBER':
+                self.__scan_error(f'Invalid number ', end)
+            elif kind == 'ERROR':
+                if source[start] == "'":
+                    self.__scan_error('Unterminated string', start)
+                elif source.startswith('(*', start):
+                    self.__scan_error('Unterminated comment', start)
+                self.__scan_error(f'Unexpected symbol: {source[start]}', start)
+            else:
+                code = codes[kind]
+            add((code, start, end, symbol))
+        if last is None:
+            # past the end of file the position keeps counting like get_next_char does
+            end = max(spans[-2] if spans else previous_end, length)
+            add((codes['EOF'], end, end, -1))
+            last = len(old) if old is not None else 0
+        spans = array('i', spans)
+        stream.kinds = array('B', spans[0::4])
+        stream.starts = spans[1::4]
+        stream.ends = spans[2::4]
+        stream.spelling_ids = spans[3::4]
+        return last
+
+    # Regex engine behind get_next_token. Tokens are produced by a generator whose __next__
+    # replaces get_next_token, without building a TokenStream. The reported (row, col) is the
+    # position of the lookahead character, past the end of file it keeps counting like
+    # get_next_char does.
+    def __scan_tokens(self):
+        source = self.source
+        length = self.length
+        reserved = Lexer.RESERVED
+        symbols = Lexer.SYMBOLS
+        count = source.count
+        rfind = source.rfind
+        row, line_start, counted = 1, -1, 0
+        self.current_pos = 0
+        # offset of a character that ends the last name and cannot start a token
+        error = None
+        for match in Lexer.TOKEN_REGEX.finditer(source):
+            kind = match.lastgroup
+            value = match.group(kind)
+            end = match.end()
+            if kind == 'NAME':
+                if not value.isascii():
+                    offset = self.__bad_name_offset(value)
+                    if offset is not None:
+                        start = match.start(kind)
+                        if not offset:
+                            self.__scan_error(f'Unexpected symbol: {value[0]}', start)
+                        # the ladder engine gives the name before that character first
+                        value, end = value[:offset], start + offset
+                        error = end
+                state = reserved.get(value.lower(), 'IDENTIFIER')
+            elif kind == 'SYMBOL':
+                state = symbols[value]
+            elif kind == 'INTEGER_VAL' or kind == 'REAL_VAL':
+                state = kind
+                if value[0] == '0':
+                    value = self.__normalize_number(value)
+            elif kind == 'COLON' or kind == 'DOT':
+                state = kind
+                value = value[0]
+                end = match.start(kind) + 2
+            elif kind == 'RELATION':
+                state = symbols.get(value)
+                if state is None:
+                    self.__scan_error(f'Unexpected symbol: {value}', end)
+            elif kind == 'STRING':
+                value = value[1:-1].replace("''", "'", 1)
+                state = 'CHAR_VAL' if len(value) == 1 else 'STRING_VAL'
+            elif kind == 'NUMBER_RANGE':
+                # the number ends one character early and its closing dot reads as '..'
+                value = self.__normalize_number(value[:-1])[:-1]
+                upto = end - 1
+                if upto > counted:
+                    newlines = count('\n', counted, upto)
+                    if newlines:
+                        row += newlines
+                        line_start = rfind('\n', counted, upto)
+                    counted = upto
+                self.current_pos = end - 1
+                yield ('REAL_VAL' if '.' in value else 'INTEGER_VAL', value, row, end - 1 - line_start)
+                state, value = 'ARRDOT', '..'
+            elif kind == 'EOF':
+                break
+            elif kind == 'INVALID_IDENTIFIER':
+                if source[end - 1].isalpha() or source[end - 1] == '_':
+                    self.__scan_error(f'Invalid identifier', end - 1)
+                # the ladder engine gives the number before that character first
+                state, value = 'INTEGER_VAL', self.__normalize_number(value[:-1])
+                end -= 1
+                error = end
+            elif kind == 'INVALID_NUMBER':
+                self.__scan_error(f'Invalid number ', end)
+            elif kind == 'ERROR':
+                start = end - 1
+                if value == "'":
+                    self.__scan_error('Unterminated string', start)
+                elif source.startswith('(*', start):
+                    self.__scan_error('Unterminated comment', start)
+                self.__scan_error(f'Unexpected symbol: {value}', start)
+            else:
+                state = kind
+            upto = end + 1 if end < length else length
+            if upto > counted:
+                newlines = count('\n', counted, upto)
+                if newlines:
+                    row += newlines
+                    line_start = rfind('\n', counted, upto)
+                counted = upto
+            self.current_pos = end
+            if end >= length:
+                self.current_char = ''
+            yield (state, value, row, end - line_start)
+            if error is not None:
+                self.__scan_error(f'Unexpected symbol: {source[error]}', error)
+        end = max(self.current_pos, length)
+        upto = length
+        if upto > counted:
+            newlines = count('\n', counted, upto)
+            if newlines:
+                row += newlines
+                line_start = rfind('\n', counted, upto)
+        self.current_pos = end
+        self.current_char = ''
+        eof = ('EOF', 'eof', row, end - line_start)
+        while True:
+            yield eof
+
+    # Offset of the first character of a NAME match the ladder engine does not take in a name,
+    # None if it takes them all. \w also takes numeric characters such as '²' and 'Ⅷ', the
+    # ladder engine starts names with letters and goes on with letters and digits
+    def __bad_name_offset(self, name):
+        for offset, char in enumerate(name):
+            if not (char.isalpha() or char == '_' or offset and char.isdigit()):
+                return offset
+        return None
+
+    def __normalize_number(self, text):
+        integer, dot, fraction = text.partition('.')
+        return f'{int(integer)}{dot}{fraction}'
+
+    def __scan_error(self, message, lookahead):
+        upto = lookahead + 1 if lookahead < self.length else self.length
+        self.row = 1 + self.source.count('\n', 0, upto)
+        self.col = lookahead - self.source.rfind('\n', 0, upto)
+        self.error(message)
+
+    # Index of current_char in the source
+    def __char_offset(self):
+        return self.current_pos - 1 if self.current_char != '' else self.length
+
     def get_next_token(self):
         self.state = None
         self.value = None
+        # value of an integer literal, as computed digit by digit
+        self.number = None
         while self.state is None:
             if self.current_char is None:
                 self.get_next_char()
@@ -130,18 +472,18 @@ class Lexer:
 
             # string quote1
             elif self.current_char == "'":
-                self.value = ""
                 self.get_next_char()
+                start = self.__char_offset()
                 while self.current_char != "'":
-                    self.value += self.current_char
                     self.get_next_char()
+                self.value = self.source[start:self.__char_offset()]
                 self.get_next_char()
                 if self.current_char == "'":
-                    self.value += "'"
                     self.get_next_char()
+                    start = self.__char_offset()
                     while self.current_char != "'":
-                        self.value += self.current_char
                         self.get_next_char()
+                    self.value += "'" + self.source[start:self.__char_offset()]
                     self.get_next_char()
                 if len(self.value) == 1:
                     self.state = 'CHAR_VAL'
@@ -192,17 +534,13 @@ class Lexer:
                     if self.current_char == '*':
                         self.state = 'COMMENT'
                         self.value = '(*'
-                        while self.current_char != "*":
-                            self.value += self.current_char
-                            self.get_next_char()
+                        start = self.__char_offset() - 1
                         self.get_next_char()
                         if self.current_char != ")":
-                            self.value += self.current_char
                             self.get_next_char()
                             while self.current_char != ")":
-                                self.value += self.current_char
                                 self.get_next_char()
-                            self.value += ')'
+                            self.value = self.source[start:self.__char_offset() + 1]
                             self.get_next_char()
                     else:
                         self.state = 'LPAREN'
@@ -214,9 +552,9 @@ class Lexer:
                     self.get_next_char()  # ?
 
             # numbers float and integer
-            elif self.current_char != None and self.current_char.isdigit():
+            elif self.current_char in Lexer.DIGITS:
                 number = 0
-                while self.current_char.isdigit():
+                while self.current_char in Lexer.DIGITS:
                     number = number * 10 + int(self.current_char)
                     self.get_next_char()
                 if self.current_char.isalpha() or self.current_char == "_":
@@ -225,7 +563,7 @@ class Lexer:
                     number = str(number)
                     number += '.'
                     self.get_next_char()
-                    while self.current_char.isdigit():
+                    while self.current_char in Lexer.DIGITS:
                         number += self.current_char
                         self.get_next_char()
                     if self.current_char == '.':
@@ -233,21 +571,24 @@ class Lexer:
                         self.current_char += '.'
                     elif number[len(number) - 1] == '.':
                         self.error(f'Invalid number ')
+                else:
+                    self.number = number
                 number = str(number)
-                self.state = 'NUMBER'
+                self.state = 'REAL_VAL' if '.' in number else 'INTEGER_VAL'
                 self.value = str(number)
 
             # identifiers, keywords and reserved names
             elif self.current_char != None and self.current_char.isalpha() or self.current_char == '_':
-                identifier = ""
+                start = self.__char_offset()
                 while self.current_char.isalpha() or self.current_char.isdigit() or self.current_char == '_':
-                    identifier += self.current_char
                     self.get_next_char()
-                if identifier.lower() in Lexer.KEYWORDS:
-                    self.state = Lexer.KEYWORDS[identifier.lower()]
+                identifier = self.source[start:self.__char_offset()]
+                key = identifier.lower()
+                if key in Lexer.KEYWORDS:
+                    self.state = Lexer.KEYWORDS[key]
                     self.value = identifier  # ?
-                elif identifier.lower() in Lexer.TYPES:
-                    self.state = Lexer.TYPES[identifier.lower()]
+                elif key in Lexer.TYPES:
+                    self.state = Lexer.TYPES[key]
                     self.value = identifier
                 else:
                     self.state = 'IDENTIFIER'
@@ -258,6 +599,277 @@ class Lexer:
         token = (self.state, self.value, self.row, self.col)
         return token
 
+# Token kinds as interned integer codes, TokenStream stores them and the Parser dispatches on them
+TokenKind = IntEnum('TokenKind', Lexer.TOKEN_KINDS, start=0)
+
+# Identifiers interned to small integer ids. Pascal identifiers are case-insensitive,
+# so every spelling of a name gets the same symbol id. Every spelling is kept once, with its own
+# spelling id: the tree keeps the spellings of the source, the symbol of one of these strings
+# is found by its identity
+class SymbolTable:
+    def __init__(self):
+        # lowercase name -> symbol id
+        self.ids = dict()
+        # spelling -> spelling id
+        self.spellings = dict()
+        # spelling id -> spelling
+        self.names = []
+        # id() of a string of `names` -> its symbol id, the table keeps these strings alive
+        self.objects = dict()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Symbol id of `name`, `key` is its lowercase form if already known
+    def intern(self, name, key = None):
+        if key is None:
+            key = name.lower()
+        symbol = self.ids.get(key)
+        if symbol is None:
+            symbol = self.ids[key] = len(self.ids)
+        return symbol
+
+    # Spelling id of `name`, its symbol is interned as well
+    def spell(self, name, key = None):
+        spelling = self.spellings.get(name)
+        if spelling is None:
+            symbol = self.intern(name, key)
+            spelling = self.spellings[name] = len(self.names)
+            self.names.append(name)
+            self.objects[id(name)] = symbol
+        return spelling
+
+    # Symbol id of `name`, without lowercasing it if it is a spelling the table gave out
+    def symbol(self, name):
+        symbol = self.objects.get(id(name))
+        return symbol if symbol is not None else self.intern(name)
+
+    def name(self, spelling):
+        return self.names[spelling]
+
+    # object ids do not survive pickling
+    def __getstate__(self):
+        return self.names
+
+    def __setstate__(self, names):
+        self.__init__()
+        for name in names:
+            self.spell(name)
+
+# Compact token stream: parallel array columns of (kind, start, end) spans into the source.
+# Values and (row, col) positions are materialized from the source only on request.
+class TokenStream:
+    # pending shifts kept before they are added to the stored offsets
+    MAX_SHIFTS = 32
+    # TokenKind by code
+    KINDS = tuple(TokenKind)
+
+    def __init__(self, source = '', symbols = None):
+        self.source = source
+        self.kinds = array('B')
+        self.starts = array('i')
+        self.ends = array('i')
+        # spelling id of every identifier token in `symbols`, -1 for the other tokens
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.spelling_ids = array('i')
+        # values and positions that can not be taken from the source span
+        self.values = dict()
+        self.positions = dict()
+        # integer literal values the lexer already has (ladder engine), see number()
+        self.numbers = dict()
+        # offsets of every '\n' in the source, built on the first position request
+        self.newlines = None
+        # shifts left by splice: the tokens from shift_indices[k] on lie shift_totals[k]
+        # characters further than their stored start/end
+        self.shift_indices = []
+        self.shift_totals = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        return self.token(index)
+
+    # Same tuples as token(), walking the lines forward instead of searching them
+    def __iter__(self):
+        if self.shift_indices:
+            self.normalize()
+        source, values, positions = self.source, self.values, self.positions
+        kinds, fixed = Lexer.TOKEN_KINDS, Lexer.FIXED_VALUES
+        length = len(source)
+        find = source.find
+        row, line_start = 1, -1
+        next_newline = find('\n')
+        for index, code, start, end in zip(range(len(self.kinds)), self.kinds, self.starts, self.ends):
+            kind = kinds[code]
+            if index in positions:
+                yield (kind, values[index], *positions[index])
+                continue
+            upto = end + 1 if end < length else length
+            while 0 <= next_newline < upto:
+                row += 1
+                line_start = next_newline
+                next_newline = find('\n', next_newline + 1)
+            value = values.get(index) or fixed.get(kind)
+            if value is None:
+                value = self.value(index) if kind != 'IDENTIFIER' else source[start:end]
+            yield (kind, value, row, end - line_start)
+
+    # Token with a value and position stored instead of a span (ladder engine)
+    def append_token(self, state, value, row, col):
+        self.values[len(self.kinds)] = value
+        self.positions[len(self.kinds)] = (row, col)
+        self.kinds.append(Lexer.KIND_CODES[state])
+        self.starts.append(-1)
+        self.ends.append(-1)
+        self.spelling_ids.append(self.symbols.spell(value) if state == 'IDENTIFIER' else -1)
+
+    def kind(self, index):
+        return TokenStream.KINDS[self.kinds[index]]
+
+    def value(self, index):
+        if index in self.values:
+            return self.values[index]
+        kind = Lexer.TOKEN_KINDS[self.kinds[index]]
+        value = Lexer.FIXED_VALUES.get(kind)
+        if value is not None:
+            return value
+        start, end = self.span(index)
+        value = self.source[start:end]
+        if kind == 'STRING_VAL' or kind == 'CHAR_VAL':
+            value = value[1:-1].replace("''", "'", 1)
+        elif (kind == 'INTEGER_VAL' or kind == 'REAL_VAL') and value[0] == '0':
+            integer, dot, fraction = value.partition('.')
+            value = f'{int(integer)}{dot}{fraction}'
+        return value
+
+    # (value, narrowest PrimitiveType) of an INTEGER_VAL or REAL_VAL token: int or float parsed
+    # from the token, no regular expressions involved. The type is None for integers out of range
+    def number(self, index):
+        number = self.numbers.get(index)
+        if number is None:
+            text = self.values.get(index)
+            if text is None:
+                start, end = self.span(index)
+                text = self.source[start:end]
+            number = int(text) if self.kinds[index] == TokenKind.INTEGER_VAL else float(text)
+        return number, get_number_type(number)
+
+    # Spelling of an identifier token as the string of SymbolTable, the value of any other token
+    def symbol(self, index):
+        spelling = self.spelling_ids[index]
+        return self.symbols.names[spelling] if spelling >= 0 else self.value(index)
+
+    # (row, col) of the lookahead character the lexer stood on after the token
+    def position(self, index):
+        if index in self.positions:
+            return self.positions[index]
+        if self.newlines is None:
+            self.newlines = array('i', [match.start() for match in re.finditer('\n', self.source)])
+        end = self.span(index)[1]
+        upto = min(end + 1, len(self.source))
+        row = bisect_left(self.newlines, upto)
+        line_start = self.newlines[row - 1] if row else -1
+        return row + 1, end - line_start
+
+    def span(self, index):
+        if self.shift_indices:
+            shift = self.__shift(index)
+            return self.starts[index] + shift, self.ends[index] + shift
+        return self.starts[index], self.ends[index]
+
+    def __shift(self, index):
+        point = bisect_right(self.shift_indices, index)
+        return self.shift_totals[point - 1] if point else 0
+
+    # Index of the first token ending at or after offset
+    def first_ending_at(self, offset):
+        return bisect_left(range(len(self.kinds)), offset, key=lambda index: self.span(index)[1])
+
+    # Index of the token the lexer started a match at offset for, -1 if there is none.
+    # The closing dot of a number range and the end of file never qualify.
+    def match_start(self, offset):
+        index = bisect_left(range(len(self.kinds)), offset, key=lambda index: self.span(index)[0])
+        if index < len(self.kinds) - 1 and self.span(index)[0] == offset and index - 1 not in self.values:
+            return index
+        return -1
+
+    # Replace tokens [first, last) by the tokens of `other`, scanned from the edited source.
+    # The tokens after them move by delta characters, which is only recorded as a shift.
+    def splice(self, first, last, other, delta, source):
+        added = len(other.kinds) - (last - first)
+        base = self.__shift(first - 1)
+        tail = self.__shift(last) + delta
+        starts, ends = other.starts, other.ends
+        if base:
+            starts = array('i', map((-base).__add__, starts))
+            ends = array('i', map((-base).__add__, ends))
+        keep = last < len(self.kinds)
+        self.kinds[first:last] = other.kinds
+        self.starts[first:last] = starts
+        self.ends[first:last] = ends
+        self.spelling_ids[first:last] = other.spelling_ids
+        indices, totals = [], []
+        for index, total in zip(self.shift_indices, self.shift_totals):
+            if index < first:
+                indices.append(index)
+                totals.append(total)
+        if keep and tail != base:
+            indices.append(first + len(other.kinds))
+            totals.append(tail)
+        for index, total in zip(self.shift_indices, self.shift_totals):
+            if keep and index > last:
+                indices.append(index + added)
+                totals.append(total + delta)
+        self.shift_indices, self.shift_totals = indices, totals
+        self.values = self.__splice_table(self.values, other.values, first, last, added)
+        self.positions = self.__splice_table(self.positions, other.positions, first, last, added)
+        self.numbers = self.__splice_table(self.numbers, other.numbers, first, last, added)
+        self.source = source
+        self.newlines = None
+        if len(self.shift_indices) > TokenStream.MAX_SHIFTS:
+            self.normalize()
+
+    def __splice_table(self, table, other, first, last, added):
+        result = {index: value for index, value in table.items() if index < first}
+        result.update((first + index, value) for index, value in other.items())
+        result.update((index + added, value) for index, value in table.items() if index >= last)
+        return result
+
+    # Add the pending shifts to the stored offsets
+    def normalize(self):
+        bounds = self.shift_indices + [len(self.kinds)]
+        for point, total in enumerate(self.shift_totals):
+            first, last = bounds[point], bounds[point + 1]
+            if total:
+                self.starts[first:last] = array('i', map(total.__add__, self.starts[first:last]))
+                self.ends[first:last] = array('i', map(total.__add__, self.ends[first:last]))
+        self.shift_indices, self.shift_totals = [], []
+
+    def token(self, index):
+        return (Lexer.TOKEN_KINDS[self.kinds[index]], self.value(index), *self.position(index))
+
+# Smallest edit turning `old` into `new`: (offset, removed length, inserted text)
+def find_edit(old, new):
+    limit = min(len(old), len(new))
+    # common prefix and suffix by halving, the slice compares run in C
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[low:middle] == new[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    prefix = low
+    low, high = 0, limit - prefix
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[len(old) - middle:len(old) - low] == new[len(new) - middle:len(new) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return prefix, len(old) - prefix - low, new[prefix:len(new) - low]
+
 if __name__ == '__main__':
     lexer = Lexer()
     lexer.add_file('test/test pascal file.pas')
@@ -1,9 +1,8 @@
-from lexer import Lexer
-from Parser import Parser
 from SemanticModule import SemanticModule
 from CodeOptimizationProcessor import CodeOptimizationProcessor as Optimizator
 from other.OptimizeChain import NotUsedVariableOptimize as NotUsedChain
-from gen import Gen
+from translator import translate
+from lexer import Lexer, find_edit
 from PyQt6 import uic
 from PyQt6.QtWidgets import QApplication, QFileDialog, QWidget, QMessageBox
 import os
@@ -19,13 +18,27 @@ form.setupUi(window)
 # form1.setupUi(window1)
 
 code = ''
-pascal = 'pascal.pas'
 
-parser = Parser()
 semantic_module = SemanticModule()
 optimizator = Optimizator()
 optimizator.add_new_chain(NotUsedChain(semantic_module= semantic_module))
 
+# Tokens of the Pascal editor, kept between translations so only edited text is lexed again
+# (Lexer.retokenize does it for the regex engine only)
+pas_lexer = Lexer(engine=Lexer.ENGINE_REGEX)
+pas_tokens = None
+
+
+def lex_pas_code(text):
+    global pas_tokens
+    if pas_tokens is None:
+        pas_lexer.add_source(text)
+        pas_tokens = pas_lexer.tokenize()
+    elif pas_tokens.source != text:
+        offset, removed, inserted = find_edit(pas_tokens.source, text)
+        pas_lexer.retokenize(pas_tokens, offset, removed, inserted)
+    return pas_tokens
+
 
 def openf():
     file = QFileDialog.getOpenFileName()
@@ -46,22 +59,11 @@ def openf():
 
 def trans():
     global code
+    code = form.pas_code.toPlainText()
     if code != '':
         try:
-            code = form.pas_code.toPlainText()
-            # global pascal
-            # with open(pascal, 'w') as f:
-            #     f.write(code)
-            #     f.flush()
-            #     f.close()
-
-            lexer = Lexer(pascal)
-            parser.set_lexer(lexer)
-            parser.set_semantic_module(semantic_module)
-            before = parser.parse()
-            # after = optimizator.start_optimization(before)
-            gen = Gen(before)
-            code = gen.code
+            with open('result.txt', 'w') as dump:
+                code = translate(code, lex_pas_code(code), dump=dump)
             form.cpp_code.setPlainText(code)
 
         except AttributeError as e:
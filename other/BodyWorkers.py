@@ -0,0 +1,118 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from other.Node import Node
+from SemanticModule import SemanticModule, TypeVariable
+import copyreg
+import io
+import pickle
+
+# Subroutine bodies parsed or checked apart from their program: by the Parser in its worker
+# processes (see Parser.set_jobs) and for lazy bodies, by SemanticAnalyzer in its workers.
+# A body sees the scope table entries declared before it, its result goes back to the main
+# process with the annotations of its nodes and the use counts it changed
+
+# Scope table that remembers the use counts of the entries read through it before they change
+# (the semantic module records them, see SemanticModule.set_scope_table).
+# A parse can only change the counts of the entries it reads
+class UseCountTable(dict):
+    def __init__(self):
+        super().__init__()
+        self.use_counts = dict()
+
+# Scope table of a body parsed apart from its program: the first entries of the program table
+# over the entries the body declares. Its semantic module keeps the scopes in step with it,
+# by the symbol ids of the program tokens
+class BodyScopeTable(UseCountTable):
+    def __init__(self, entries, symbols):
+        super().__init__()
+        self.entries = entries
+        self.semantic_module = SemanticModule()
+        self.semantic_module.set_symbol_table(symbols)
+        self.semantic_module.set_scope_table(self)
+
+    # Show exactly the first `length` entries
+    def set_visible(self, length):
+        if length < len(self):
+            self.clear()
+            self.semantic_module.set_scope_table(self)
+        self.semantic_module.update_scope_table(self.entries[len(self):length])
+
+# Use counts a job changed in the entries of the main process (`positions` by their ids), as
+# sorted (position, difference) pairs. The counts are put back for the next job of the worker.
+# Also the positions of the declared types among them, by their ids
+def take_use_counts(table, positions):
+    changed = list()
+    # the declared types are the only entries of the main process the fields of nodes can refer to
+    shared = dict()
+    for variable, use_count in table.use_counts.values():
+        position = positions.get(id(variable))
+        if position is None:
+            continue
+        if variable.use_count != use_count:
+            changed.append((position, variable.use_count - use_count))
+            variable.use_count = use_count
+        if isinstance(variable, TypeVariable):
+            shared[id(variable)] = position
+    table.use_counts.clear()
+    return sorted(changed), shared
+
+# Reducers of a worker job result pickler: the usual ones, and for the nodes the usual reduction
+# that also collects the nodes with annotations (see Node.ANNOTATIONS), their pickled state has none
+class _NodeReducers(dict):
+    def __init__(self):
+        super().__init__(copyreg.dispatch_table)
+        self.annotated = list()
+
+    def __missing__(self, cls):
+        if not issubclass(cls, Node):
+            raise KeyError(cls)
+        reduce = self[cls] = self.__reduce_node
+        return reduce
+
+    def __reduce_node(self, node):
+        if getattr(node, 'symbol', None) is not None or getattr(node, 'value_type', None) is not None:
+            self.annotated.append(node)
+        return node.__reduce_ex__(pickle.DEFAULT_PROTOCOL)
+
+# Result of a worker job: its values, then the annotations of the nodes among them and its use
+# count changes. The shared types are sent as their positions, as well as the annotations naming
+# entries of the main process (`positions` by their ids), load_body_result resolves them back
+def dump_body_result(values, changed, shared, positions):
+    result = io.BytesIO()
+    pickler = pickle.Pickler(result)
+    if shared:
+        pickler.persistent_id = lambda obj: shared.get(id(obj))
+    pickler.dispatch_table = reducers = _NodeReducers()
+    pickler.dump(values)
+    annotations = list()
+    for node in reducers.annotated:
+        symbol = getattr(node, 'symbol', None)
+        annotations.append((node, positions.get(id(symbol), symbol), getattr(node, 'value_type', None)))
+    pickler.dump((annotations, changed))
+    return result.getvalue()
+
+# Values of a worker job result with their annotations, its use count changes are added to
+# `entries`. The annotated nodes are added to the reference index of `semantic_module` if given
+def load_body_result(result, entries, semantic_module = None):
+    unpickler = pickle.Unpickler(io.BytesIO(result))
+    unpickler.persistent_load = lambda position: entries[position][1]
+    values = unpickler.load()
+    annotations, use_counts = unpickler.load()
+    for node, symbol, value_type in annotations:
+        if symbol is not None:
+            node.symbol = entries[symbol][1] if isinstance(symbol, int) else symbol
+            if semantic_module is not None:
+                semantic_module.add_reference(node)
+        if value_type is not None:
+            node.value_type = value_type
+    for position, use_count in use_counts:
+        entries[position][1].use_count += use_count
+    return values
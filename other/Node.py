@@ -1,4 +1,39 @@
+# Узлы хранят поля в __slots__, без __dict__ у каждого экземпляра.
+# Каждый класс объявляет только свои новые поля, в порядке их присваивания в __init__
 class Node:
+    __slots__ = ()
+    # Все поля узла, от базового класса к наследнику
+    fields = ()
+    # Пометки семантического анализа (см. SemanticModule): слоты с этими именами - не поля.
+    # symbol - объект идентификатора, value_type - тип значения выражения.
+    # Их нет в дампе, pickle, NodeArena и NodeSerializer, без них узел просто считается заново.
+    # Тела из других процессов получают их отдельно, см. BodyWorkers.dump_body_result
+    ANNOTATIONS = ('symbol', 'value_type')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get('__slots__', ())
+        cls.fields = cls.fields + tuple(name for name in slots if name not in Node.ANNOTATIONS)
+
+    # Заданные поля в виде словаря, как у обычного объекта (например, 'type' in node.__dict__)
+    @property
+    def __dict__(self):
+        attrs = dict()
+        for name in self.fields:
+            value = getattr(self, name, Node)
+            if value is not Node:
+                attrs[name] = value
+        return attrs
+
+    # Для pickle (разбор тел подпрограмм в других процессах) - значения полей по порядку
+    def __getstate__(self):
+        return tuple(getattr(self, name, Node) for name in self.fields)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.fields, state):
+            if value is not Node:
+                setattr(self, name, value)
+
     def __get_class_name(self):
         c = str(self.__class__)
         pos_1 = c.find('.')+1
@@ -6,25 +41,66 @@ class Node:
         return f"{c[pos_1:pos_2]}"
 
     def __repr__(self, level=0):
-        attrs = self.__dict__
-        if len(attrs) == 1 and isinstance(list(attrs.values())[0], list):
-            is_sequence = True
-        else:
-            is_sequence = False
-        res = f"{self.__get_class_name()}\n"
-        if is_sequence:
-            elements = list(attrs.values())[0]
-            for el in elements:
-                res += '|   ' * level
-                res += "|+-"
-                res += el.__repr__(level+1)
+        return ''.join(self.iter_dump(level=level))
+
+    # Дамп дерева по кусочкам, без рекурсии - стек генераторов вместо стека вызовов.
+    # Узлы глубже max_depth выводятся только именем класса и ' ...'
+    def iter_dump(self, max_depth=None, level=0):
+        class_names = dict()
+        stack = [iter(((self, level, 0),))]
+        while stack:
+            for item in stack[-1]:
+                if isinstance(item, str):
+                    yield item
+                    continue
+                node, level, depth = item
+                # поля читаются до имени класса: NodeLazySubroutine при этом становится NodeSubroutine
+                attrs = node.__dict__
+                if node.__class__ not in class_names:
+                    class_names[node.__class__] = node.__get_class_name()
+                if max_depth is not None and depth >= max_depth and attrs:
+                    yield f"{class_names[node.__class__]} ...\n"
+                else:
+                    yield f"{class_names[node.__class__]}\n"
+                    stack.append(Node.__dump_items(attrs, level, depth + 1))
+                break
+            else:
+                stack.pop()
+
+    # Строки и дочерние узлы (node, level, depth) одного узла, в формате прежнего __repr__
+    @staticmethod
+    def __dump_items(attrs, level, depth):
+        indent = '|   ' * level + "|+-"
+        values = list(attrs.values())
+        if len(attrs) == 1 and isinstance(values[0], list):
+            for el in values[0]:
+                yield indent
+                yield (el, level+1, depth) if isinstance(el, Node) else f"{el}\n"
         else:
-            for attr_name in attrs:
-                res += '|   ' * level
-                res += "|+-"
-                if isinstance(attrs[attr_name], Node):
-                    res += f"{attr_name}: {attrs[attr_name].__repr__(level+1)}"
+            for attr_name, value in attrs.items():
+                if isinstance(value, Node):
+                    yield f"{indent}{attr_name}: "
+                    yield value, level+1, depth
+                elif isinstance(value, list) and value and all(isinstance(el, Node) for el in value):
+                    # как str(list): узлы с нулевого уровня через запятую
+                    yield f"{indent}{attr_name}: ["
+                    for index, el in enumerate(value):
+                        if index:
+                            yield ", "
+                        yield el, 0, depth
+                    yield "]\n"
                 else:
-                    res += f"{attr_name}: {attrs[attr_name]}\n"
-                    
-        return res
\ No newline at end of file
+                    yield f"{indent}{attr_name}: {value}\n"
+
+    # Записать дамп дерева в файл кусками примерно по chunk_size символов
+    def write_dump(self, file, max_depth=None, chunk_size=1 << 16):
+        chunk = []
+        size = 0
+        for part in self.iter_dump(max_depth):
+            chunk.append(part)
+            size += len(part)
+            if size >= chunk_size:
+                file.write(''.join(chunk))
+                chunk.clear()
+                size = 0
+        file.write(''.join(chunk))
\ No newline at end of file
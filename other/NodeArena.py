@@ -0,0 +1,228 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from other.Node import Node
+from other.SupportClasses import NodeLazySubroutine
+from array import array
+
+# Плоское хранение дерева для очень больших программ.
+# Узел - целое число (handle), его данные лежат в параллельных массивах:
+# kinds[handle] - класс узла (индекс в NodeArena.CLASSES),
+# offsets[handle] - начало его полей в slots, по одному числу на поле из Node.fields.
+# Поле кодируется числом: (payload << 2) | тег, где тег
+# NODE - payload это handle узла, LIST - номер списка, VALUE - индекс в values
+# (строки, перечисления, числа - общие для одинаковых значений), UNSET - поле не задано.
+# Элементы списка number лежат подряд в items[list_starts[number]:][:list_lengths[number]].
+# Коды 32-битные, так что в арене помещается до 2**29 узлов
+NODE, LIST, VALUE, UNSET = range(4)
+
+class NodeArena:
+    # Классы узлов и их представления, общие для всех арен
+    CLASSES = []
+    VIEWS = []
+    KINDS = dict()
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.offsets = array('I')
+        self.slots = array('i')
+        self.list_starts = array('I')
+        self.list_lengths = array('I')
+        self.items = array('i')
+        self.values = []
+        self.value_index = dict()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Класс представления для узлов класса cls: наследник cls, поля которого - свойства,
+    # читающие и пишущие арену. Имя и модуль те же, что у cls, поэтому дамп дерева не меняется
+    @classmethod
+    def __register(cls, node_class):
+        namespace = {'__slots__': ('arena', 'handle'), '__module__': node_class.__module__,
+                     '__qualname__': node_class.__qualname__, 'node_class': node_class}
+        for index, name in enumerate(node_class.fields):
+            namespace[name] = NodeArena.__field_property(index, name)
+        view_class = type(node_class.__name__, (NodeView, node_class), namespace)
+        view_class.fields = node_class.fields
+        cls.KINDS[node_class] = len(cls.CLASSES)
+        cls.KINDS[view_class] = len(cls.CLASSES)
+        cls.CLASSES.append(node_class)
+        cls.VIEWS.append(view_class)
+        if len(cls.CLASSES) > 256:
+            raise OverflowError('NodeArena: too many node classes')
+
+    # Свойство поля index: то же, что get_field, без лишних вызовов - поля читаются очень часто
+    @staticmethod
+    def __field_property(index, name):
+        views = NodeArena.VIEWS
+        def get(view):
+            arena = view.arena
+            code = arena.slots[arena.offsets[view.handle] + index]
+            tag = code & 3
+            if tag == VALUE:
+                return arena.values[code >> 2]
+            if tag == NODE:
+                return views[arena.kinds[code >> 2]](arena, code >> 2)
+            if tag == LIST:
+                return ArenaList(arena, code >> 2)
+            raise AttributeError(f'{name} is not set')
+        def set(view, value):
+            view.arena.set_field(view.handle, index, value)
+        return property(get, set)
+
+    # Переносит дерево node в арену и возвращает представление его корня.
+    # Узлы-представления этой же арены не копируются, остальные узлы копируются без рекурсии
+    def add(self, node : Node) -> Node:
+        stack = []
+        code = self.__encode(node, stack)
+        self.__fill(stack)
+        return self.decode(code)
+
+    def get_field(self, handle, index):
+        code = self.slots[self.offsets[handle] + index]
+        if code & 3 == UNSET:
+            raise AttributeError(f'{NodeArena.CLASSES[self.kinds[handle]].fields[index]} is not set')
+        return self.decode(code)
+
+    def set_field(self, handle, index, value):
+        stack = []
+        code = self.__encode(value, stack)
+        self.__fill(stack)
+        self.slots[self.offsets[handle] + index] = code
+
+    # Записывает новое содержимое списка number, на старом месте если оно помещается
+    def set_list(self, number, elements):
+        stack = []
+        codes = [self.__encode(element, stack) for element in elements]
+        if len(codes) > self.list_lengths[number]:
+            self.list_starts[number] = len(self.items)
+            self.items.extend(codes)
+        else:
+            start = self.list_starts[number]
+            self.items[start:start + len(codes)] = array('i', codes)
+        self.list_lengths[number] = len(codes)
+        self.__fill(stack)
+
+    # Записывает поля узлов, получивших handle в __encode
+    def __fill(self, stack):
+        slots = self.slots
+        encode = self.__encode
+        while stack:
+            offset, node, fields = stack.pop()
+            for index, name in enumerate(fields):
+                value = getattr(node, name, Node)
+                if value is not Node:
+                    slots[offset + index] = encode(value, stack)
+
+    # Число для значения поля. Новый узел только получает handle и место под поля,
+    # сами поля записываются позже из stack
+    def __encode(self, value, stack):
+        kind = NodeArena.KINDS.get(type(value))
+        if kind is None and isinstance(value, Node):
+            if isinstance(value, NodeLazySubroutine):
+                # после разбора тела узел - обычный NodeSubroutine
+                value.load()
+                return self.__encode(value, stack)
+            # общий узел (см. NodeFactory) хранится как обычный, его представление можно менять
+            node_class = getattr(value, 'unshared_class', value.__class__)
+            if node_class not in NodeArena.KINDS:
+                NodeArena.__register(node_class)
+            kind = NodeArena.KINDS[value.__class__] = NodeArena.KINDS[node_class]
+        if kind is not None:
+            if isinstance(value, NodeView) and value.arena is self:
+                return value.handle << 2 | NODE
+            fields = NodeArena.CLASSES[kind].fields
+            handle = len(self.kinds)
+            self.kinds.append(kind)
+            self.offsets.append(len(self.slots))
+            stack.append((len(self.slots), value, fields))
+            self.slots.extend([UNSET] * len(fields))
+            return handle << 2 | NODE
+        if type(value) is list or isinstance(value, ArenaList):
+            codes = [self.__encode(element, stack) for element in value]
+            number = len(self.list_starts)
+            self.list_starts.append(len(self.items))
+            self.list_lengths.append(len(codes))
+            self.items.extend(codes)
+            return number << 2 | LIST
+        try:
+            # тип в ключе, чтобы 'BYTE' и PrimitiveType.BYTE, 1 и True не склеивались
+            key = (type(value), value)
+            index = self.value_index.get(key)
+            if index is None:
+                index = self.value_index[key] = len(self.values)
+                self.values.append(value)
+        except TypeError: # unhashable
+            index = len(self.values)
+            self.values.append(value)
+        return index << 2 | VALUE
+
+    def decode(self, code):
+        tag = code & 3
+        if tag == NODE:
+            return NodeArena.VIEWS[self.kinds[code >> 2]](self, code >> 2)
+        if tag == VALUE:
+            return self.values[code >> 2]
+        return ArenaList(self, code >> 2)
+
+    # Примерный объём арены в байтах
+    def memory_size(self):
+        columns = (self.kinds, self.offsets, self.slots, self.list_starts, self.list_lengths, self.items)
+        return sum(sys.getsizeof(column) for column in columns) + sys.getsizeof(self.values)
+
+# Общий предок представлений узлов арены. Представления одного узла равны между собой.
+# pickle и copy получают обычный узел класса node_class
+class NodeView(Node):
+    __slots__ = ()
+
+    def __init__(self, arena, handle):
+        self.arena = arena
+        self.handle = handle
+
+    def __eq__(self, other):
+        if isinstance(other, NodeView):
+            return self.arena is other.arena and self.handle == other.handle
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.arena), self.handle))
+
+    def __reduce_ex__(self, protocol):
+        return _new_node, (self.node_class,), self.__getstate__()
+
+def _new_node(node_class):
+    return node_class.__new__(node_class)
+
+# Список из поля узла арены: копия элементов, которая при изменении записывает себя обратно
+class ArenaList(list):
+    __slots__ = ('arena', 'number')
+
+    def __init__(self, arena, number):
+        start = arena.list_starts[number]
+        decode = arena.decode
+        super().__init__(decode(code) for code in arena.items[start:start + arena.list_lengths[number]])
+        self.arena = arena
+        self.number = number
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+def _write_back(method):
+    def write_back(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.arena.set_list(self.number, self)
+        return result
+    write_back.__name__ = method.__name__
+    return write_back
+
+for name in ('append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse',
+             '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+    setattr(ArenaList, name, _write_back(getattr(list, name)))
@@ -0,0 +1,126 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from other.Node import Node
+from collections import Counter
+
+# Общие (hash-consing) узлы выражений: одинаковые по структуре поддеревья - один объект.
+# Узел становится общим, когда все его узлы-потомки уже общие, а остальные значения
+# полей хешируемы. Общий узел получает класс-наследник своего класса с тем же именем,
+# который запрещает менять поля - изменять можно только копию (см. writable)
+class SharedNode(Node):
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        if name in self.fields:
+            raise AttributeError(f'{self.__class__.__name__} is shared, change its copy (see writable)')
+        super().__setattr__(name, value)
+
+    # pickle и copy получают обычный узел
+    def __reduce_ex__(self, protocol):
+        return _new_node, (self.unshared_class,), self.__getstate__()
+
+def _new_node(node_class):
+    return node_class.__new__(node_class)
+
+# Узел, который можно менять: сам узел или, если он общий, его копия со своими списками
+def writable(node : Node) -> Node:
+    if not isinstance(node, SharedNode):
+        return node
+    node_class = node.unshared_class
+    copy = node_class.__new__(node_class)
+    for name in node.fields:
+        value = getattr(node, name, Node)
+        if value is not Node:
+            setattr(copy, name, list(value) if isinstance(value, list) else value)
+    return copy
+
+class NotShareable(Exception):
+    pass
+
+class NodeFactory:
+    # Общие классы по обычным, одни для всех фабрик
+    SHARED_CLASSES = dict()
+
+    def __init__(self):
+        self.table = dict()
+        self.requested = Counter()
+        self.unique = Counter()
+        self.saved_size = 0
+
+    @classmethod
+    def __shared_class(cls, node_class):
+        shared_class = cls.SHARED_CLASSES.get(node_class)
+        if shared_class is None:
+            namespace = {'__slots__': (), '__module__': node_class.__module__,
+                         '__qualname__': node_class.__qualname__, 'unshared_class': node_class}
+            shared_class = type(node_class.__name__, (SharedNode, node_class), namespace)
+            shared_class.fields = node_class.fields
+            cls.SHARED_CLASSES[node_class] = shared_class
+        return shared_class
+
+    # Общий узел, равный node (сам node, если такого ещё не было), или node без изменений,
+    # если его нельзя сделать общим
+    def share(self, node : Node) -> Node:
+        if isinstance(node, SharedNode):
+            return node
+        try:
+            key = (node.__class__,) + tuple(self.__key(getattr(node, name, Node)) for name in node.fields)
+        except NotShareable:
+            return node
+        shared = self.table.get(key)
+        # аннотации (см. Node.ANNOTATIONS) в ключ не входят: переменная другой области
+        # с тем же именем остаётся обычным узлом, как и выражения над ней
+        if shared is not None and getattr(shared, 'symbol', None) is not getattr(node, 'symbol', None):
+            return node
+        name = node.__class__.__name__
+        self.requested[name] += 1
+        if shared is not None:
+            self.saved_size += self.__size(node)
+            return shared
+        self.unique[name] += 1
+        node.__class__ = NodeFactory.__shared_class(node.__class__)
+        self.table[key] = node
+        # ключ живёт столько же, сколько фабрика, и съедает часть экономии
+        self.saved_size -= sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key if isinstance(part, tuple))
+        return node
+
+    # Память узла вместе с его списками
+    @staticmethod
+    def __size(node : Node) -> int:
+        return sys.getsizeof(node) + sum(sys.getsizeof(getattr(node, name, None)) for name in node.fields
+                                         if isinstance(getattr(node, name, None), list))
+
+    # Часть ключа для значения поля: общий узел - сам объект (сравнение по id),
+    # остальное - вместе с типом, чтобы 'INTEGER' и PrimitiveType.INTEGER не склеивались
+    def __key(self, value):
+        if isinstance(value, SharedNode):
+            return value
+        if isinstance(value, Node):
+            raise NotShareable()
+        if isinstance(value, list):
+            return tuple(self.__key(item) for item in value)
+        try:
+            hash(value)
+        except TypeError:
+            raise NotShareable()
+        return (value.__class__, value)
+
+    # Отчёт об экономии: сколько узлов каждого класса создано и сколько из них осталось;
+    # экономия считается за вычетом таблицы общих узлов
+    def report(self) -> str:
+        lines = []
+        for name, requested in self.requested.most_common():
+            lines.append(f'{name}: {requested} nodes, {self.unique[name]} unique')
+        requested, unique = sum(self.requested.values()), sum(self.unique.values())
+        saved = self.saved_size - sys.getsizeof(self.table)
+        lines.append(f'total: {requested} nodes, {unique} unique, {requested - unique} shared, '
+                     f'about {saved / 1e3:.0f} KB saved')
+        return '\n'.join(lines)
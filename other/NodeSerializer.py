@@ -0,0 +1,227 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from other.Node import Node
+from other.SupportClasses import NodeLazySubroutine
+import other.SupportClasses as support_classes
+from SemanticModule import TypeVariable
+from enum import Enum
+import struct
+
+# Двоичный формат дерева - для передачи между процессами и кэша разобранных программ.
+# Заголовок: MAGIC, версия, таблица строк (длина и utf-8 байты каждой строки),
+# таблица классов узлов (имя и имена полей - индексы в таблице строк), затем корень.
+# Значение - байт тега и данные: NODE - номер класса и значения его полей по порядку,
+# LIST - длина и элементы, STRING - номер строки, ENUM - номера строк имени перечисления
+# и значения, INT - число в zigzag, FLOAT - 8 байт. Все числа - varint (по 7 бит в байте).
+# Именованный тип (TypeVariable, его Parser оставляет типом элементов массива) - TYPE: номер
+# строки имени и значение его типа, повторная ссылка на тот же объект - TYPE_REF и номер типа
+# в порядке записи. При чтении тип собирается заново, один объект на каждый записанный.
+# Дерево записывается и читается без рекурсии
+MAGIC = b'PAST'
+VERSION = 2
+UNSET, NONE, FALSE, TRUE, INT, FLOAT, STRING, ENUM, LIST, NODE, TYPE, TYPE_REF = range(12)
+
+# Классы узлов и перечисления, которые можно прочитать, по имени
+CLASSES = {name: value for name, value in vars(support_classes).items()
+           if isinstance(value, type) and issubclass(value, (Node, Enum))}
+
+_double = struct.Struct('<d')
+
+def _write_varint(out, number):
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+def dumps(node : Node) -> bytes:
+    body = bytearray()
+    strings = dict()
+    classes = dict()
+    class_list = []
+    types = dict()
+
+    def string_index(string):
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+        return index
+
+    # Node вместо значения - поле не задано, как в Node.__getstate__
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if value is Node:
+            body.append(UNSET)
+        elif isinstance(value, Node):
+            if isinstance(value, NodeLazySubroutine):
+                # после разбора тела узел - обычный NodeSubroutine
+                value.load()
+            name = value.__class__.__name__
+            index = classes.get(name)
+            if index is None:
+                index = classes[name] = len(class_list)
+                class_list.append((string_index(name), [string_index(field) for field in value.fields]))
+            body.append(NODE)
+            _write_varint(body, index)
+            stack.extend(getattr(value, field, Node) for field in reversed(value.fields))
+        elif isinstance(value, TypeVariable):
+            index = types.get(id(value))
+            if index is not None:
+                body.append(TYPE_REF)
+                _write_varint(body, index)
+                continue
+            types[id(value)] = len(types)
+            body.append(TYPE)
+            _write_varint(body, string_index(value.identifier))
+            stack.append(value.type)
+        elif isinstance(value, list):
+            body.append(LIST)
+            _write_varint(body, len(value))
+            stack.extend(reversed(value))
+        elif isinstance(value, Enum):
+            body.append(ENUM)
+            _write_varint(body, string_index(value.__class__.__name__))
+            _write_varint(body, string_index(value.value))
+        elif isinstance(value, str):
+            body.append(STRING)
+            _write_varint(body, string_index(value))
+        elif value is None:
+            body.append(NONE)
+        elif value is True or value is False:
+            body.append(TRUE if value else FALSE)
+        elif isinstance(value, int):
+            body.append(INT)
+            _write_varint(body, value << 1 if value >= 0 else (-value << 1) - 1)
+        elif isinstance(value, float):
+            body.append(FLOAT)
+            body += _double.pack(value)
+        else:
+            raise TypeError(f'NodeSerializer: cannot write {value.__class__.__name__}')
+
+    header = bytearray(MAGIC)
+    _write_varint(header, VERSION)
+    _write_varint(header, len(strings))
+    for string in strings:
+        data = string.encode('utf-8')
+        _write_varint(header, len(data))
+        header += data
+    _write_varint(header, len(class_list))
+    for name, fields in class_list:
+        _write_varint(header, name)
+        _write_varint(header, len(fields))
+        for field in fields:
+            _write_varint(header, field)
+    return bytes(header + body)
+
+# Читает дерево из bytes, bytearray, memoryview или mmap без копирования данных
+def loads(data) -> Node:
+    view = memoryview(data).cast('B')
+    if view[:len(MAGIC)] != MAGIC:
+        raise ValueError('NodeSerializer: not a serialized tree')
+    position = len(MAGIC)
+
+    def read_varint():
+        nonlocal position
+        number = shift = 0
+        while True:
+            byte = view[position]
+            position += 1
+            number |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    version = read_varint()
+    if version != VERSION:
+        raise ValueError(f'NodeSerializer: unsupported version {version}')
+    strings = []
+    for _ in range(read_varint()):
+        length = read_varint()
+        strings.append(str(view[position:position + length], 'utf-8'))
+        position += length
+    classes = []
+    for _ in range(read_varint()):
+        name = strings[read_varint()]
+        if name not in CLASSES:
+            raise ValueError(f'NodeSerializer: unknown node class {name}')
+        classes.append((CLASSES[name], [strings[read_varint()] for _ in range(read_varint())]))
+    enums = dict()
+    types = []
+
+    # Кадр - [узел или список, имена полей (None у списка), номер следующего значения, число значений]
+    result = []
+    stack = [[result, None, 0, 1]]
+    while stack:
+        frame = stack[-1]
+        target, names, index, count = frame
+        if index == count:
+            stack.pop()
+            continue
+        frame[2] = index + 1
+        tag = view[position]
+        position += 1
+        child = None
+        # однобайтовые varint - самый частый случай, без вызова функции
+        if tag >= STRING:
+            number = view[position]
+            if number < 0x80:
+                position += 1
+            else:
+                number = read_varint()
+        if tag == NODE:
+            node_class, fields = classes[number]
+            value = node_class.__new__(node_class)
+            child = [value, fields, 0, len(fields)]
+        elif tag == STRING:
+            value = strings[number]
+        elif tag == ENUM:
+            key = (number, read_varint())
+            value = enums.get(key)
+            if value is None:
+                if strings[number] not in CLASSES:
+                    raise ValueError(f'NodeSerializer: unknown enumeration {strings[number]}')
+                value = enums[key] = CLASSES[strings[number]](strings[key[1]])
+        elif tag == TYPE:
+            value = TypeVariable(strings[number])
+            types.append(value)
+            child = [value, ('type',), 0, 1]
+        elif tag == TYPE_REF:
+            value = types[number]
+        elif tag == LIST:
+            value = []
+            child = [value, None, 0, number]
+        elif tag == UNSET:
+            continue
+        elif tag == NONE:
+            value = None
+        elif tag == TRUE or tag == FALSE:
+            value = tag == TRUE
+        elif tag == INT:
+            number = read_varint()
+            value = number >> 1 if not number & 1 else -((number + 1) >> 1)
+        elif tag == FLOAT:
+            value = _double.unpack_from(view, position)[0]
+            position += _double.size
+        else:
+            raise ValueError(f'NodeSerializer: bad tag {tag} at {position - 1}')
+        if names is None:
+            target.append(value)
+        else:
+            setattr(target, names[index], value)
+        if child is not None:
+            stack.append(child)
+    return result[0]
+
+def dump(node : Node, file):
+    file.write(dumps(node))
+
+def load(file) -> Node:
+    return loads(file.read())
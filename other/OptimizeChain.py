@@ -9,6 +9,7 @@ except ValueError: # Already removed
     pass
 
 from other.Node import Node
+from other.Visitor import Transformer, ExpressionVisitor
 from other.SupportClasses import *
 from SemanticModule import SemanticModule, TypeVariable
 
@@ -42,7 +43,7 @@ class OptimizeChain:
     def _optimize(self, tree_node : Node) -> Node:
         pass 
 
-class NotUsedVariableOptimize(OptimizeChain):
+class NotUsedVariableOptimize(OptimizeChain, Transformer):
 
     def __init__(self, 
                  next = None,
@@ -50,112 +51,196 @@ class NotUsedVariableOptimize(OptimizeChain):
         super().__init__(next)
         self.__semantic_module = semantic_module
         self.__current_scope = list()
+        # assigned variable node -> [(statement, statement part)] of the program scope, see __cut_assignments
+        self.__assignments = None
+        # placements of the assignments whose statement part is not made yet
+        self.__placements = list()
+        # objects whose use counts went down in the last pass over the tree
+        self.__touched = None
 
     def set_semantic_module(self, module):
         self.__semantic_module = module
     
+    # The first pass walks the whole tree. After it only the declarations and the assignments
+    # of the program scope can go, they are found by the reference index of the semantic module
+    # (see SemanticModule.add_reference), and only the objects whose use counts went down can
+    # become unused. A tree the module did not index (see SemanticModule.set_indexed_tree),
+    # e.g. one kept in an arena or read by NodeSerializer, is walked on every pass
     def _optimize(self, tree_node : NodeProgram) -> Node:
+        self.__load_bodies(tree_node)
         scope_table = self.__semantic_module.get_scope_table().copy()
-        self.__scope_table = scope_table
-        while True:
-            unused_variables = dict(filter(lambda pair: pair[1].use_count == 0, scope_table.items()))
-            if len(unused_variables) == 0:
-                break
-            unused_names = [pair[1].identifier for pair in unused_variables.items()]
-            declaration = tree_node.global_declaration
-            tree_node.global_declaration = self.__cut_declarations(declaration, unused_names)
-            statements = tree_node.statement_part
-            tree_node.statement_part = self.__cut_statement_part(statements, unused_names)
+        indexed = self.__semantic_module.is_indexed_tree(tree_node)
+        self.__assignments = dict() if indexed else None
+        self.__placements = list()
+        self.__touched = dict()
+        # id of an object -> its names in the table
+        names = dict()
+        for full_name, variable in scope_table.items():
+            names.setdefault(id(variable), []).append(full_name)
+        unused_variables = dict(filter(lambda pair: pair[1].use_count == 0, scope_table.items()))
+        first = True
+        while len(unused_variables) != 0:
+            unused_symbols = {self.__semantic_module.get_symbol(variable.identifier) for variable in unused_variables.values()}
+            if first or not indexed:
+                declaration = tree_node.global_declaration
+                tree_node.global_declaration = self.__cut_declarations(declaration, unused_symbols)
+                statements = tree_node.statement_part
+                tree_node.statement_part = self.__cut_statement_part(statements, unused_symbols)
+            else:
+                self.__cut_assignments(tree_node, unused_symbols)
+            first = False
             for full_name, unused_variable in unused_variables.items():
                 type_iter = unused_variable.type
                 while isinstance(type_iter, TypeVariable):
                     type_iter.use_count -= 1
+                    self.__touched[id(type_iter)] = type_iter
                     type_iter = type_iter.type
                 del scope_table[full_name]
+            touched, self.__touched = self.__touched.values(), dict()
+            unused_variables = {full_name: variable for variable in touched if variable.use_count == 0
+                                for full_name in names.get(id(variable), ()) if scope_table.get(full_name) is variable}
+        self.__assignments = None
         return tree_node
+
+    # The uses in a lazy body (see Parser.set_lazy) are only counted when it is parsed,
+    # the bodies are parsed before the use counts are read
+    def __load_bodies(self, tree_node):
+        if not isinstance(tree_node, NodeProgram):
+            return
+        for node in tree_node.global_declaration.declaration_list:
+            if isinstance(node, NodeLazySubroutine):
+                node.load()
+
+    # Declarations and assignments of the program scope naming the unused symbols, found by the
+    # references of the global objects they name. The assignments were recorded by the first pass
+    def __cut_assignments(self, tree_node, unused_symbols):
+        module = self.__semantic_module
+        global_scope = module.get_scope()
+        declarations = set()
+        statement_parts = dict()
+        for symbol in unused_symbols:
+            variable = global_scope.symbols.get(symbol)
+            if variable is None:
+                continue
+            for node in module.get_references(variable):
+                if isinstance(node, NodeVariableDeclaration):
+                    declarations.add(node)
+                for statement, statement_part in self.__assignments.pop(node, ()):
+                    statement_parts.setdefault(statement_part, set()).add(statement)
+                    self.__drop_statement(statement)
+        if declarations:
+            declaration_part = tree_node.global_declaration
+            declaration_list = list()
+            for declaration in declaration_part.declaration_list:
+                if declaration in declarations:
+                    module.remove_references(declaration)
+                else:
+                    declaration_list.append(declaration)
+            declaration_part.declaration_list = declaration_list
+        for statement_part, statements in statement_parts.items():
+            statement_part.statements = [statement for statement in statement_part.statements if statement not in statements]
         
+    # Declarations and statements of the tree without the unused variables.
+    # Statements other than if, cycles, for and expressions are dropped as well
     def __cut_declarations(self, 
                            declaration_part: NodeDeclarationPart, 
-                           unused_names : list[str]):
-        filtered_declarations = list()
-        for declaration in declaration_part.declaration_list:
-            if isinstance(declaration, NodeSubroutine):
-                self.__current_scope.append(declaration.identifier)
-                subroutine = self.__cut_subroutine(declaration, unused_names)
-                self.__current_scope.pop()
-                filtered_declarations.append(subroutine)
-            else:
-                full_name = self.__semantic_module.convert_to_name(self.__current_scope, declaration.identifier)
-                if full_name not in unused_names:
-                    filtered_declarations.append(declaration)
-        return NodeDeclarationPart(filtered_declarations)
-
-
-    def __cut_subroutine(self, 
-                         subroutine : NodeSubroutine, 
-                         unused_names : list[str]):
-        declaration = subroutine.declaration_part
-        subroutine.declaration_part = self.__cut_declarations(declaration, unused_names)
-        statements = subroutine.statement_part
-        subroutine.statement_part = self.__cut_statement_part(statements, unused_names)
-        return subroutine
-        
+                           unused_symbols : set[int]):
+        return self.visit(declaration_part, unused_symbols)
+
     def __cut_statement_part(self, 
                              statement_part : NodeStatementPart, 
-                             unused_names : list[str]):
-        filtered_statements = list()
-        for statement in statement_part.statements:
-            match statement:
-                case NodeIfStatement():
-                    if statement.then_statement_part:
-                        statement.then_statement_part = self.__cut_statement_part(statement.then_statement_part, unused_names)
-                    if statement.else_statement_part:
-                        statement.else_statement_part = self.__cut_statement_part(statement.else_statement_part, unused_names)
-                    filtered_statements.append(statement)
-                case NodeCycleStatement():
-                    statement.statement_part = self.__cut_statement_part(statement.statement_part, unused_names)
-                    filtered_statements.append(statement)
-                case NodeForStatement():
-                    statement.statement_part = self.__cut_statement_part(statement.statement_part, unused_names)
-                    filtered_statements.append(statement)
-                case NodeBinaryOperator() | NodeUnaryOperator():
-                    if self.__make_post_order_traversal(statement, unused_names):
-                        filtered_statements.append(statement)         
-        return NodeStatementPart(filtered_statements)
-
-    def __make_post_order_traversal(self, top, unused_names):
-        all_variables = []
-        stack = [top]
-        visited = []
-        assign_variable_name = ''
-        while len(stack) > 0:
-            top = stack.pop()
-            if isinstance(top, NodeBinaryOperator):
-                if top.operation_type == Operator.ASSIGN:
-                    var_iter = top.left
-                    while not isinstance(var_iter, NodeVariable):
-                        var_iter = var_iter.left
-                    assign_variable_name = self.__semantic_module.convert_to_name(self.__current_scope, var_iter.identifier)
-                if top.left not in visited and top.right not in visited:
-                    stack.append(top)
-                    stack.append(top.right)
-                    stack.append(top.left)
-                else:
-                    visited.append(top)
-            elif isinstance(top, NodeUnaryOperator):
-                if top.left not in visited:
-                    stack.append(top)
-                    stack.append(top.left)
-                else:
-                    visited.append(top)
-                    result.append(top.operation_type)
-            else:
-                visited.append(top)
-                if isinstance(top, NodeVariable):
-                    full_name = self.__semantic_module.convert_to_name(self.__current_scope, top.identifier)
-                    all_variables.append(full_name)
-        if assign_variable_name in unused_names:
-            for variable in all_variables:
-                self.__scope_table[variable].use_count -= 1
-            return False
-        return True
\ No newline at end of file
+                             unused_symbols : set[int]):
+        return self.visit(statement_part, unused_symbols)
+
+    def visit_Node(self, node, unused_symbols):
+        self.__semantic_module.remove_references(node)
+        return None
+
+    def visit_NodeDeclarationPart(self, declaration_part, unused_symbols):
+        return NodeDeclarationPart(self.__filter(declaration_part.declaration_list, unused_symbols))
+
+    def visit_NodeStatementPart(self, statement_part, unused_symbols):
+        start = len(self.__placements)
+        statement_part = NodeStatementPart(self.__filter(statement_part.statements, unused_symbols))
+        # the nested parts took their placements, the rest are statements of this one
+        for placement in self.__placements[start:]:
+            placement[1] = statement_part
+        del self.__placements[start:]
+        return statement_part
+
+    def __filter(self, nodes, unused_symbols):
+        filtered = list()
+        for node in nodes:
+            node = self.visit(node, unused_symbols)
+            if node is not None:
+                filtered.append(node)
+        return filtered
+
+    def visit_NodeSubroutine(self, subroutine, unused_symbols):
+        self.__current_scope.append(subroutine.identifier)
+        subroutine.declaration_part = self.visit(subroutine.declaration_part, unused_symbols)
+        subroutine.statement_part = self.visit(subroutine.statement_part, unused_symbols)
+        self.__current_scope.pop()
+        return subroutine
+
+    # Unused identifiers are matched by symbol in the program scope only,
+    # the full names of local variables never were bare identifiers
+    def __is_unused(self, identifier, unused_symbols):
+        return not self.__current_scope and self.__semantic_module.get_symbol(identifier) in unused_symbols
+
+    def visit_NodeVariableDeclaration(self, declaration, unused_symbols):
+        if not self.__is_unused(declaration.identifier, unused_symbols):
+            return declaration
+        self.__semantic_module.remove_references(declaration)
+        return None
+
+    def visit_NodeIfStatement(self, statement, unused_symbols):
+        if statement.then_statement_part:
+            statement.then_statement_part = self.visit(statement.then_statement_part, unused_symbols)
+        if statement.else_statement_part:
+            statement.else_statement_part = self.visit(statement.else_statement_part, unused_symbols)
+        return statement
+
+    def visit_NodeCycleStatement(self, statement, unused_symbols):
+        statement.statement_part = self.visit(statement.statement_part, unused_symbols)
+        return statement
+
+    visit_NodeForStatement = visit_NodeCycleStatement
+
+    # An expression statement is dropped if it assigns an unused variable,
+    # the variables it reads lose one use then
+    def visit_NodeBinaryOperator(self, statement, unused_symbols):
+        assign_variable = None
+        for top in ExpressionVisitor().walk(statement):
+            if isinstance(top, NodeBinaryOperator) and top.operation_type == Operator.ASSIGN:
+                assign_variable = top.left
+                while not isinstance(assign_variable, NodeVariable):
+                    assign_variable = assign_variable.left
+        if assign_variable is None:
+            return statement
+        if self.__is_unused(assign_variable.identifier, unused_symbols):
+            self.__drop_statement(statement)
+            return None
+        if self.__assignments is not None and not self.__current_scope:
+            placement = [statement, None]
+            self.__assignments.setdefault(assign_variable, []).append(placement)
+            self.__placements.append(placement)
+        return statement
+
+    def __drop_statement(self, statement):
+        for variable in ExpressionVisitor().walk(statement):
+            if isinstance(variable, NodeVariable):
+                variable = self.__get_variable(variable)
+                variable.use_count -= 1
+                self.__touched[id(variable)] = variable
+        self.__semantic_module.remove_references(statement)
+
+    # Object of a variable node: the one semantics found for it (see SemanticModule),
+    # or the one its name finds if the node has none, e.g. it was read by NodeSerializer
+    def __get_variable(self, node):
+        variable = getattr(node, 'symbol', None)
+        if variable is None:
+            variable = self.__semantic_module.find_object(self.__current_scope, node.identifier)
+        return variable
+
+    visit_NodeUnaryOperator = visit_NodeBinaryOperator
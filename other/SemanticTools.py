@@ -10,6 +10,7 @@ except ValueError: # Already removed
 
 from other.SupportClasses import Operator as OP
 from other.SupportClasses import PrimitiveType as PT
+from other.SupportClasses import CONDITION_OPERATOR_BITS
 from typing import Final
 import re
 import math
@@ -110,6 +111,43 @@ for type_pair, return_type in base_type_upcast.items():
 base_type_upcast.update(reverse_upcast)
 del reverse_upcast
 
+# The lattice above as dense tables: types and operators are numbered by their type_id and
+# operator_id, the result of an operation is one index into a flat list (None - not supported).
+# Plain lists rather than arrays: the results are the PrimitiveType members themselves
+TYPE_COUNT : Final = len(PT)
+OPERATOR_COUNT : Final = len(OP)
+TYPE_IDS : Final = {t: t.type_id for t in PT}
+OPERATOR_IDS : Final = {o: o.operator_id for o in OP}
+
+binary_upcast_table = [None] * (TYPE_COUNT * TYPE_COUNT * OPERATOR_COUNT)
+unary_upcast_table = [None] * (TYPE_COUNT * OPERATOR_COUNT)
+assign_support_table = bytearray(TYPE_COUNT * TYPE_COUNT)
+for key, return_type in base_type_upcast.items():
+    if len(key) == 3:
+        type1, type2, oper = key
+        binary_upcast_table[(type1.type_id * TYPE_COUNT + type2.type_id) * OPERATOR_COUNT + oper.operator_id] = return_type
+    elif isinstance(key[1], OP):
+        unary_upcast_table[key[0].type_id * OPERATOR_COUNT + key[1].operator_id] = return_type
+    # (type, type) pairs left by reverse_upcast are never looked up
+for type1, type2 in assign_support:
+    assign_support_table[type1.type_id * TYPE_COUNT + type2.type_id] = 1
+
+# Number of a type or of an operator, None if it is not one. Names of types
+# given as plain strings (e.g. element types of arrays) are types as well
+def get_type_id(type):
+    type_id = getattr(type, 'type_id', None)
+    return type_id if type_id is not None else TYPE_IDS.get(type)
+
+def get_operator_id(oper):
+    operator_id = getattr(oper, 'operator_id', None)
+    return operator_id if operator_id is not None else OPERATOR_IDS.get(oper)
+
+def is_assign_supported(type_1, type_2):
+    id_1, id_2 = get_type_id(type_1), get_type_id(type_2)
+    if id_1 is None or id_2 is None:
+        return False
+    return assign_support_table[id_1 * TYPE_COUNT + id_2] == 1
+
 def is_value_number(value):
     return re.match(INTEGER_REGEX, value) != None or re.match(FLOAT_REGEX, value)
 
@@ -125,30 +163,35 @@ def is_value_boolean(value):
 def is_value_char(value):
     return len(value) == 1
 
+# Narrowest integer type of a number, the first of the *_RANGE_CHECK ranges holding it, found by
+# its bit length: unsigned types for the numbers from 0 on, signed ones for the negative numbers
+# (by the bits of -number - 1). None if no range holds it
+UNSIGNED_BY_BIT_LENGTH : Final = [PT.BYTE] * 9 + [PT.WORD] * 8 + [PT.LONGWORD] * 16 + [PT.UINT64] * 32
+SIGNED_BY_BIT_LENGTH : Final = [PT.SHORTINT] * 8 + [PT.SMALLINT] * 8 + [PT.INTEGER] * 16 + [PT.INT64] * 32
+
+def get_integer_type(number):
+    if number >= 0:
+        bit_length, types = number.bit_length(), UNSIGNED_BY_BIT_LENGTH
+    else:
+        bit_length, types = (~number).bit_length(), SIGNED_BY_BIT_LENGTH
+    return types[bit_length] if bit_length < len(types) else None
+
+# Type of a number parsed by the lexer (see TokenStream.number): REAL for a float
+def get_number_type(number):
+    return get_integer_type(number) if isinstance(number, int) else PT.REAL
+
 def get_integer_value_type(value):
-    match int(value):
-        case num if BYTE_RANGE_CHECK(num):
-            result = PT.BYTE
-        case num if WORD_RANGE_CHECK(num):
-            result = PT.WORD
-        case num if LONGWORD_RANGE_CHECK(num):
-            result = PT.LONGWORD
-        case num if UINT64_RANGE_CHECK(num):
-            result = PT.UINT64
-        case num if SHORTINT_RANGE_CHECK(num):
-            result = PT.SHORTINT
-        case num if SMALLINT_RANGE_CHECK(num):
-            result = PT.SMALLINT
-        case num if INTEGER_RANGE_CHECK(num):
-            result = PT.INTEGER
-        case num if INT64_RANGE_CHECK(num):
-            result = PT.INT64
-        case _:
-            raise Error(f'OUT OF RANGE: {-MAX_INT64_VALUE} AND {MAX_UINT64_VALUE}')
+    result = get_integer_type(int(value))
+    if result is None:
+        raise Error(f'OUT OF RANGE: {-MAX_INT64_VALUE} AND {MAX_UINT64_VALUE}')
     return result
 
 def get_value_type(value):
-    if is_value_integer(value):
+    # plain integers, e.g. folded negative literals, skip the regular expressions
+    digits = value[1:] if value[:1] == '-' or value[:1] == '+' else value
+    if digits.isdigit() and digits.isascii():
+        _type = get_integer_value_type(value)
+    elif is_value_integer(value):
         _type = get_integer_value_type(value)
     elif is_value_float(value):
         _type = PT.REAL
@@ -160,13 +203,24 @@ def get_value_type(value):
         _type = PT.STRING
     return _type
 
+# Type of an operation result, KeyError with the key of base_type_upcast if it is not supported
 def cast_types_by_operator(type_1, type_2, oper):
-    if oper in OP.get_condition_operators():
+    operator_id = get_operator_id(oper)
+    if operator_id is not None and CONDITION_OPERATOR_BITS >> operator_id & 1:
         return PT.BOOLEAN
+    id_1 = get_type_id(type_1)
     if type_2 is not None:
-        return base_type_upcast[type_1, type_2, oper]
-    else:
-        return base_type_upcast[type_1, oper]
+        id_2 = get_type_id(type_2)
+        if id_1 is not None and id_2 is not None and operator_id is not None:
+            return_type = binary_upcast_table[(id_1 * TYPE_COUNT + id_2) * OPERATOR_COUNT + operator_id]
+            if return_type is not None:
+                return return_type
+        raise KeyError((type_1, type_2, oper))
+    if id_1 is not None and operator_id is not None:
+        return_type = unary_upcast_table[id_1 * OPERATOR_COUNT + operator_id]
+        if return_type is not None:
+            return return_type
+    raise KeyError((type_1, oper))
 
 def conver_value_to_boolean(value):
     if is_value_integer(value) or is_value_float(value):
@@ -36,6 +36,12 @@ class Operator(StrEnum):
     def get_condition_operators(cls):
         return [cls.GREATER, cls.SMALLER, cls.EQUALITY, cls.NONEQUALITY, cls.GREATER_OR_EQUAL, cls.SMALLER_OR_EQUAL]
 
+# Плотные номера операторов (0, 1, 2...) для таблиц SemanticTools и биты для масок
+for operator_id, operator in enumerate(Operator):
+    operator.operator_id = operator_id
+    operator.operator_bit = 1 << operator_id
+CONDITION_OPERATOR_BITS = sum(operator.operator_bit for operator in Operator.get_condition_operators())
+
 # Тип функции
 class SubroutineType(StrEnum):
     PROCEDURE = 'PROCEDURE'; FUNCTION = 'FUNCTION'
@@ -86,26 +92,33 @@ class PrimitiveType(StrEnum):
     @classmethod
     def get_unsigned_int_by_weight(cls, weight):
         if weight > 8: weight = 8
-        types = [cls.BYTE, cls.WORD, cls.LONGWORD, cls.UINT64]
-        return list(filter(lambda x: x.byte_weight == weight, types))[0]
+        return UNSIGNED_INTEGER_BY_WEIGHT[weight]
 
     @classmethod
     def get_signed_int_by_weight(cls, weight):
         if weight > 8: weight = 8
-        types = [cls.SHORTINT, cls.SMALLINT, cls.INTEGER, cls.INT64]
-        return list(filter(lambda x: x.byte_weight == weight, types))[0]
-    
+        return SIGNED_INTEGER_BY_WEIGHT[weight]
+
+    # Бит типа (type_bit) для масок ниже, 0 - не тип. Строка с именем типа - тоже тип
+    @classmethod
+    def get_type_bit(cls, type):
+        type_bit = getattr(type, 'type_bit', None)
+        if type_bit is None:
+            member = cls._value2member_map_.get(type) if isinstance(type, str) else None
+            type_bit = 0 if member is None else member.type_bit
+        return type_bit
+
     @classmethod
     def is_type_unsigned_integer(cls, type):
-        return type in [cls.BYTE, cls.WORD, cls.LONGWORD, cls.UINT64]
+        return cls.get_type_bit(type) & UNSIGNED_INTEGER_BITS != 0
     
     @classmethod
     def is_type_signed_integer(cls, type):
-        return type in [cls.SHORTINT, cls.SMALLINT, cls.INTEGER, cls.INT64]
+        return cls.get_type_bit(type) & SIGNED_INTEGER_BITS != 0
 
     @classmethod
     def is_type_integer(cls, type):
-        return type in [cls.BYTE, cls.WORD, cls.LONGWORD, cls.UINT64, cls.SHORTINT, cls.SMALLINT, cls.INTEGER, cls.INT64]
+        return cls.get_type_bit(type) & INTEGER_BITS != 0
 
     @classmethod
     def get_all_integer_types(cls):
@@ -115,34 +128,54 @@ class PrimitiveType(StrEnum):
     def get_float_types(cls):
         return [cls.SINGLE, cls.REAL, cls.DOUBLE, cls.SINGLE]
 
+# Плотные номера типов (type_id) для таблиц SemanticTools и биты для масок классов типов
+for type_id, primitive_type in enumerate(PrimitiveType):
+    primitive_type.type_id = type_id
+    primitive_type.type_bit = 1 << type_id
+UNSIGNED_INTEGER_BITS = sum(t.type_bit for t in (PrimitiveType.BYTE, PrimitiveType.WORD,
+                                                 PrimitiveType.LONGWORD, PrimitiveType.UINT64))
+SIGNED_INTEGER_BITS = sum(t.type_bit for t in (PrimitiveType.SHORTINT, PrimitiveType.SMALLINT,
+                                               PrimitiveType.INTEGER, PrimitiveType.INT64))
+INTEGER_BITS = UNSIGNED_INTEGER_BITS | SIGNED_INTEGER_BITS
+UNSIGNED_INTEGER_BY_WEIGHT = {t.byte_weight: t for t in (PrimitiveType.BYTE, PrimitiveType.WORD,
+                                                         PrimitiveType.LONGWORD, PrimitiveType.UINT64)}
+SIGNED_INTEGER_BY_WEIGHT = {t.byte_weight: t for t in (PrimitiveType.SHORTINT, PrimitiveType.SMALLINT,
+                                                       PrimitiveType.INTEGER, PrimitiveType.INT64)}
+
+# Списки и узлы по умолчанию создаются для каждого узла свои, а не общие на все
 class NodeStatementPart(Node):
-    def __init__(self, statements = list()):
-        self.statements = statements
+    __slots__ = ('statements',)
+    def __init__(self, statements = None):
+        self.statements = list() if statements is None else statements
     def append(self, statement):
         self.statements.append(statement)
 
 # Основная программа
 class MainNode(Node):
+    __slots__ = ('program_type', 'node_body')
     def __init__(self, program_type = ProgramType.PROGRAM, node_body = None):
         self.program_type = program_type
         self.node_body = node_body
 
 class NodeDeclarationPart(Node):
-    def __init__(self, declaration_list = list()):
-        self.declaration_list = declaration_list
+    __slots__ = ('declaration_list',)
+    def __init__(self, declaration_list = None):
+        self.declaration_list = list() if declaration_list is None else declaration_list
 
 # Класс для описания программы (НЕ модуля)
 class NodeProgram(Node):
+    __slots__ = ('identifier', 'global_declaration', 'statement_part')
     def __init__(self, 
                  identifier= '', 
-                 global_declaration= NodeDeclarationPart(list()), 
-                 statement_part = NodeStatementPart()):
+                 global_declaration= None, 
+                 statement_part = None):
         self.identifier = identifier
-        self.global_declaration = global_declaration
-        self.statement_part = statement_part
+        self.global_declaration = NodeDeclarationPart() if global_declaration is None else global_declaration
+        self.statement_part = NodeStatementPart() if statement_part is None else statement_part
 
 # Класс для хранение значения и его типа (возможно уберу)
 class NodeValue(Node):
+    __slots__ = ('value', 'type')
     def __init__(self, value, _type):
         self.value = value
         self.type = _type
@@ -151,15 +184,18 @@ class NodeValue(Node):
 # identifier - название объявляемого - всегда строка
 # type - тип объявляемого - всегда строка и НЕ ХРАНИТ УЗЕЛ ДЕРЕВА (для себя)
 # value - для константы - начальное значение
+# symbol - объявленный объект семантики (пометка, не поле)
 class NodeVariableDeclaration(Node):
+    __slots__ = ('identifier', 'type', 'symbol')
     def __init__(self, 
                  identifier = '', 
                  _type = ''):
         self.identifier = identifier
         self.type = _type
 class NodeTypeDeclaration(NodeVariableDeclaration):
-    pass
+    __slots__ = ()
 class NodeConstantDeclaration(NodeVariableDeclaration):
+    __slots__ = ('expression',)
     def __init__(self,
                  identifier = '',
                  _type = '',
@@ -169,8 +205,9 @@ class NodeConstantDeclaration(NodeVariableDeclaration):
 
 # Формальные параметры для класса (Что объявляется при создании)
 class NodeSubroutineFormalParams(Node):
-    def __init__(self, params = list()):
-        self.params = params
+    __slots__ = ('params',)
+    def __init__(self, params = None):
+        self.params = list() if params is None else params
     def append(self, param):
         self.params.append(param)
     def extend(self, params):
@@ -182,35 +219,85 @@ class NodeSubroutineFormalParams(Node):
 # declaration_part - блок объявления переменных .типов и т.д.
 # statement_part - блок операндов
 # is_forward_declaration - объявление подпрограммы заранее (ещё не обрабатывается, но скоро будет)
+# symbol - объект подпрограммы в семантике (пометка, не поле)
 class NodeSubroutine(Node):
+    __slots__ = ('identifier', 'subroutine_type', 'type', 'formal_params',
+                 'declaration_part', 'statement_part', 'is_forward_declaration', 'symbol')
     def __init__(self, 
                  subroutine_type = SubroutineType.PROCEDURE, 
                  identifier = '',
                  type = None,
-                 formal_params = NodeSubroutineFormalParams(),
-                 declaration_part = NodeDeclarationPart(),
-                 statement_part = NodeStatementPart(),
+                 formal_params = None,
+                 declaration_part = None,
+                 statement_part = None,
                  is_forward_declaration = False):
         self.identifier = identifier
         self.subroutine_type = subroutine_type
         self.type = type
-        self.formal_params = formal_params
+        self.formal_params = NodeSubroutineFormalParams() if formal_params is None else formal_params
+        self.declaration_part = NodeDeclarationPart() if declaration_part is None else declaration_part
+        self.statement_part = NodeStatementPart() if statement_part is None else statement_part
+        self.is_forward_declaration = is_forward_declaration
+
+# Подпрограмма с отложенным разбором тела (Parser.set_lazy)
+# parse_body - возвращает (declaration_part, statement_part), вызывается при первом обращении к ним,
+# после этого узел становится обычным NodeSubroutine.
+# До разбора parse_body хранится в слоте declaration_part, свойства ниже закрывают его,
+# поэтому слоты NodeSubroutine читаются и пишутся через их дескрипторы.
+# load() разбирает тело явно, например перед обходом, которому нужен уже разобранный узел
+class NodeLazySubroutine(NodeSubroutine):
+    __slots__ = ()
+    def __init__(self, subroutine : NodeSubroutine, parse_body):
+        for name, value in subroutine.__dict__.items():
+            getattr(NodeSubroutine, name).__set__(self, value)
+        if hasattr(subroutine, 'symbol'):
+            self.symbol = subroutine.symbol
+        NodeSubroutine.declaration_part.__set__(self, parse_body)
+
+    def load(self):
+        declaration_part, statement_part = NodeSubroutine.declaration_part.__get__(self)()
+        self.__class__ = NodeSubroutine
         self.declaration_part = declaration_part
         self.statement_part = statement_part
-        self.is_forward_declaration = is_forward_declaration
+
+    @property
+    def declaration_part(self):
+        self.load()
+        return self.declaration_part
+
+    @declaration_part.setter
+    def declaration_part(self, declaration_part):
+        self.load()
+        self.declaration_part = declaration_part
+
+    @property
+    def statement_part(self):
+        self.load()
+        return self.statement_part
+
+    @statement_part.setter
+    def statement_part(self, statement_part):
+        self.load()
+        self.statement_part = statement_part
+
+    def __repr__(self, level=0):
+        self.load()
+        return self.__repr__(level)
 
 # Класс для объявления границ массива
 class NodeArrayRange(Node):
+    __slots__ = ('left_bound', 'right_bound')
     def __init__(self,
-                 left_bound = NodeValue(0, PrimitiveType.BYTE),
-                 right_bound = NodeValue(0, PrimitiveType.BYTE)):
-        self.left_bound = left_bound
-        self.right_bound = right_bound
+                 left_bound = None,
+                 right_bound = None):
+        self.left_bound = NodeValue(0, PrimitiveType.BYTE) if left_bound is None else left_bound
+        self.right_bound = NodeValue(0, PrimitiveType.BYTE) if right_bound is None else right_bound
 class NodeArrayType(Node):
+    __slots__ = ('array_ranges', 'type')
     def __init__(self,
-                 array_ranges = list(), 
+                 array_ranges = None, 
                  _type = None):
-        self.array_ranges = array_ranges
+        self.array_ranges = list() if array_ranges is None else array_ranges
         self.type = _type
     def append(self, range : NodeArrayRange):
         self.array_ranges.append(range)
@@ -219,6 +306,7 @@ class NodeArrayType(Node):
 
 # Класс для объявления типов (Нужен только для возврата из семантики)
 class NodeType(Node):
+    __slots__ = ('identifier', 'type')
     def __init__(self, identifier = None, _type = None):
         self.identifier = identifier
         self.type = _type
@@ -226,20 +314,24 @@ class NodeType(Node):
         return self.identifier
 
 # Класс для объявления переменной
+# symbol и value_type - найденный объект и его тип (пометки семантики, не поля)
 class NodeVariable(Node):
+    __slots__ = ('identifier', 'symbol', 'value_type')
     def __init__(self, 
                  identifier = ''):
         self.identifier = identifier
 
 # Класс для объявления передаваемых параметров в подпрограмму (ещё использу для обращения к массиву)
 class NodeCallParams(Node):
-    def __init__(self, params = list()):
-        self.params = params
+    __slots__ = ('params',)
+    def __init__(self, params = None):
+        self.params = list() if params is None else params
     def append(self, param):
         self.params.append(param) 
 
 # Класс унарной операции 
 class NodeUnaryOperator(Node):
+    __slots__ = ('left', 'operation_type', 'value_type')
     def __init__(self, 
                  left, 
                  operation_type = Operator.UNARY_PLUS):
@@ -253,7 +345,9 @@ class NodeUnaryOperator(Node):
 # в left нужно вставить NodeVariable, а в right - что присваивается
 # Так: NodeBinaryOperator(NodeVariable('test_name'), <Выражение>, Operator.ASSIGN)
 # Аналогично и для операций обращения к массиву (Operator.ARRAY_CALL) и для вызова подпрограмм
+# value_type - тип результата (пометка семантики, не поле)
 class NodeBinaryOperator(Node):
+    __slots__ = ('left', 'right', 'operation_type', 'value_type')
     def __init__(self, left, right, operation_type = Operator.PLUS):
         self.left = left
         self.right = right
@@ -265,29 +359,33 @@ class NodeBinaryOperator(Node):
 # иначе возвразаемый тип не будет BOOLEAN и выкенет ошибку
 # expression - не счиьается
 class NodeIfStatement(Node):
+    __slots__ = ('condition', 'then_statement_part', 'else_statement_part')
     def __init__(self, 
                  condition = None, 
-                 then_statement_part = NodeStatementPart(), 
-                 else_statement_part = NodeStatementPart()):
+                 then_statement_part = None, 
+                 else_statement_part = None):
         self.condition = condition
-        self.then_statement_part = then_statement_part
-        self.else_statement_part = else_statement_part 
+        self.then_statement_part = NodeStatementPart() if then_statement_part is None else then_statement_part
+        self.else_statement_part = NodeStatementPart() if else_statement_part is None else else_statement_part
       
+# default_block задаётся только при наличии else
 class NodeSwitchStatement(Node):
+    __slots__ = ('variable', 'case_blocks', 'default_block')
     def __init__(self, 
                  variable = None, 
-                 case_blocks = list(),
-                 default_block = NodeStatementPart()):
+                 case_blocks = None,
+                 default_block = None):
         self.variable = variable
-        self.case_blocks = case_blocks
+        self.case_blocks = list() if case_blocks is None else case_blocks
     def append(self, case_block):
         self.case_blocks.append(case_block)
 class NodeCaseBlock(Node):
+    __slots__ = ('case_list', 'statement_part')
     def __init__(self, 
-                 case_list = list(), 
-                 statement_part = NodeStatementPart(list())):
-        self.case_list = case_list
-        self.statement_part = statement_part
+                 case_list = None, 
+                 statement_part = None):
+        self.case_list = list() if case_list is None else case_list
+        self.statement_part = NodeStatementPart() if statement_part is None else statement_part
     
     def append_case(self, case):
         self.case_list.append( case)
@@ -296,26 +394,29 @@ class NodeCaseBlock(Node):
 
 # Класс для цикла while и repeat
 class NodeCycleStatement(Node):
-    def __init__(self, condition = None, statement_part = NodeStatementPart(list())):
+    __slots__ = ('condition', 'statement_part')
+    def __init__(self, condition = None, statement_part = None):
         self.condition = condition
-        self.statement_part = statement_part
+        self.statement_part = NodeStatementPart() if statement_part is None else statement_part
 
-class NodeWhileStatement(NodeCycleStatement): pass
-class NodeRepeatUntilStatement(NodeCycleStatement): pass
+class NodeWhileStatement(NodeCycleStatement): __slots__ = ()
+class NodeRepeatUntilStatement(NodeCycleStatement): __slots__ = ()
 
 class NodeForStatement(Node):
+    __slots__ = ('variable', 'initial_expression', 'end_expression', 'statement_part', 'is_increase')
     def __init__(self, 
                  variable = None, 
                  initial_expression = None, 
                  end_expression = None, 
-                 statement_part = NodeStatementPart(), 
+                 statement_part = None, 
                  is_increase = False):
         self.variable = variable
         self.initial_expression = initial_expression
         self.end_expression = end_expression
-        self.statement_part = statement_part
+        self.statement_part = NodeStatementPart() if statement_part is None else statement_part
         self.is_increase = is_increase
 
 class NodeComment(Node):
+    __slots__ = ('comment',)
     def __init__(self, comment):
         self.comment = comment
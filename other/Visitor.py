@@ -0,0 +1,140 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from other.Node import Node
+from other.NodeFactory import writable
+
+# Method calling `prefix + <node class name>` of the visitor, for the node class or its nearest
+# base class that has one (`object` is the last base of every class), generic_visit if none has.
+# The choice is made once per visitor class and node class, later calls cost two dict lookups
+def dispatcher(prefix):
+    tables = dict()
+
+    def dispatch(self, node, *args):
+        try:
+            function = tables[self.__class__][node.__class__]
+        except KeyError:
+            function = _find_handler(self.__class__, prefix, node.__class__)
+            tables.setdefault(self.__class__, dict())[node.__class__] = function
+        return function(self, node, *args)
+
+    dispatch.__name__ = prefix.rstrip('_')
+    return dispatch
+
+def _find_handler(visitor_class, prefix, node_class):
+    for base in node_class.__mro__:
+        function = getattr(visitor_class, prefix + base.__name__, None)
+        if function is not None:
+            return function
+    return visitor_class.generic_visit
+
+# Base class for tree walkers, handlers are visit_<node class name>(node, *args).
+# visit() and generic_visit() recurse into the children, walk() and traverse() do not
+class Visitor:
+    visit = dispatcher('visit_')
+    # Child nodes of a node, children_Node gives every node found in its fields and lists
+    children = dispatcher('children_')
+
+    def children_object(self, node):
+        return ()
+
+    def generic_visit(self, node, *args):
+        for child in self.children(node):
+            self.visit(child, *args)
+
+    def children_Node(self, node):
+        children = []
+        for name in node.fields:
+            value = getattr(node, name, None)
+            if isinstance(value, Node):
+                children.append(value)
+            elif isinstance(value, list):
+                children.extend(item for item in value if isinstance(item, Node))
+        return children
+
+    # All nodes of the tree, parents before children, without recursion
+    def walk(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(self.children(node)))
+
+    # visit() of every node of the tree without recursion, the handlers do not visit the children.
+    # With post_order a node is visited after its children
+    def traverse(self, node, *args, post_order = False):
+        if not post_order:
+            for node in self.walk(node):
+                self.visit(node, *args)
+            return
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                self.visit(node, *args)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(self.children(node)))
+
+    # Value of the tree computed bottom-up without recursion: visit() of every node after its
+    # children, the value it returns is kept in `results` (a dict by node) where the handlers
+    # find the values of the children. Subtrees already in `results` are not walked again
+    def evaluate(self, node, results, *args):
+        stack = [(node, False)]
+        while stack:
+            top, expanded = stack.pop()
+            if top in results:
+                continue
+            if expanded:
+                results[top] = self.visit(top, results, *args)
+            else:
+                stack.append((top, True))
+                stack.extend((child, False) for child in reversed(self.children(top)))
+        return results[node]
+
+# Visitor that rebuilds the tree: visit() returns the node to put in place of the given one,
+# None drops it from a list. generic_visit() does that for every child and returns the node,
+# a copy of it if it is shared (see NodeFactory) and a child changed
+class Transformer(Visitor):
+
+    def generic_visit(self, node, *args):
+        for name in node.fields:
+            value = getattr(node, name, None)
+            if isinstance(value, Node):
+                new_value = self.visit(value, *args)
+                if new_value is not value:
+                    node = writable(node)
+                    setattr(node, name, new_value)
+            elif isinstance(value, list):
+                new_list = []
+                for item in value:
+                    if isinstance(item, Node):
+                        new_item = self.visit(item, *args)
+                        if new_item is not None:
+                            new_list.append(new_item)
+                    else:
+                        new_list.append(item)
+                if len(new_list) != len(value) or any(new is not old for new, old in zip(new_list, value)):
+                    node = writable(node)
+                    getattr(node, name)[:] = new_list
+        return node
+
+# Visitor of an expression: the children are the operands of unary and binary operators,
+# call parameters and array indices are not walked into
+class ExpressionVisitor(Visitor):
+
+    def children_Node(self, node):
+        return ()
+
+    def children_NodeUnaryOperator(self, node):
+        return (node.left,)
+
+    def children_NodeBinaryOperator(self, node):
+        return (node.left, node.right)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from lexer import Lexer, find_edit
+from benchmark import generate_program, collect_tokens
+
+SOURCE = generate_program(50)
+
+def test_engines_give_the_same_tokens():
+    assert collect_tokens(SOURCE, Lexer.ENGINE_LADDER) == collect_tokens(SOURCE, Lexer.ENGINE_REGEX)
+
+def test_span_stream_matches_the_tuples():
+    stream = Lexer(source=SOURCE, engine=Lexer.ENGINE_REGEX).tokenize()
+    assert list(stream) == collect_tokens(SOURCE, Lexer.ENGINE_REGEX)
+
+def test_retokenize_matches_a_full_lexing():
+    # the ladder engine lexes the whole source again, the result has to be the same
+    for engine in (Lexer.ENGINE_REGEX, Lexer.ENGINE_LADDER):
+        source = SOURCE
+        lexer = Lexer(source=source, engine=engine)
+        stream = lexer.tokenize()
+        for edit in range(20):
+            offset = source.index(';', edit * len(source) // 20)
+            edited = source[:offset] + ' ' + source[offset:]
+            lexer.retokenize(stream, *find_edit(source, edited))
+            source = edited
+        assert list(stream) == list(Lexer(source=source, engine=Lexer.ENGINE_REGEX).tokenize())
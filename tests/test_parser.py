@@ -0,0 +1,158 @@
+import io
+import sys
+from pathlib import Path
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+try:
+    sys.path.remove(str(parent))
+except ValueError: # Already removed
+    pass
+
+from lexer import Lexer, find_edit
+from Parser import Parser
+from SemanticModule import SemanticModule, SyntaxOnlyModule
+from SemanticAnalyzer import SemanticAnalyzer
+from other.NodeArena import NodeArena
+from other.NodeFactory import NodeFactory
+from other.NodeSerializer import dumps, loads
+from other.SupportClasses import PrimitiveType
+from other.OptimizeChain import NotUsedVariableOptimize
+from other.Visitor import Visitor
+from benchmark import generate_program, generate_parentheses, generate_nesting, parse
+
+PROGRAM = generate_program(50)
+
+# Tree without the unused variables, see NotUsedVariableOptimize
+def optimize(source, lazy = False, arena = None):
+    semantic_module = SemanticModule()
+    parser = Parser(source=source)
+    parser.set_semantic_module(semantic_module)
+    parser.set_lazy(lazy)
+    parser.set_arena(arena)
+    optimizer = NotUsedVariableOptimize(semantic_module=semantic_module)
+    return optimizer.process_optimization(parser.parse())
+
+# Tree parsed without checks and the analyzer that checked it afterwards
+def analyze(source, jobs = 1):
+    syntax_module = SyntaxOnlyModule()
+    parser = Parser(source=source)
+    parser.set_semantic_module(syntax_module)
+    tree = parser.parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.set_jobs(jobs)
+    analyzer.analyze(tree, syntax_module)
+    return tree, analyzer
+
+def test_parallel_parsing_gives_the_same_tree():
+    assert str(parse(PROGRAM, 2)) == str(parse(PROGRAM))
+
+def test_lazy_bodies_keep_the_optimized_tree():
+    assert str(optimize(PROGRAM, lazy=True)) == str(optimize(PROGRAM))
+
+def test_separate_checks_give_the_same_tree():
+    for jobs in (1, 2):
+        assert str(analyze(PROGRAM, jobs)[0]) == str(parse(PROGRAM))
+
+# Annotations of every node and the number of references of every declared object,
+# the objects by their names in the scope table
+def annotations(tree, semantic_module):
+    scope_table = semantic_module.get_scope_table()
+    names = {id(variable): name for name, variable in scope_table.items()}
+    nodes = [(node.__class__.__name__, names.get(id(getattr(node, 'symbol', None))), getattr(node, 'value_type', None))
+             for node in Visitor().walk(tree)]
+    references = {name: len(semantic_module.get_references(variable)) for name, variable in scope_table.items()}
+    return nodes, references
+
+def test_bodies_of_other_processes_are_annotated_and_indexed():
+    semantic_module = SemanticModule()
+    parser = Parser(source=PROGRAM)
+    parser.set_semantic_module(semantic_module)
+    expected = annotations(parser.parse(), semantic_module)
+    for jobs in (1, 2):
+        semantic_module = SemanticModule()
+        parser = Parser(source=PROGRAM)
+        parser.set_semantic_module(semantic_module)
+        parser.set_jobs(jobs)
+        assert annotations(parser.parse(), semantic_module) == expected
+        tree, analyzer = analyze(PROGRAM, jobs)
+        assert annotations(tree, analyzer.get_semantic_module()) == expected
+
+def test_incremental_reparse_gives_the_same_tree():
+    source = PROGRAM
+    lexer = Lexer(source=source, engine=Lexer.ENGINE_REGEX)
+    stream = lexer.tokenize()
+    parser = Parser(tokens=stream)
+    parser.set_semantic_module(SemanticModule())
+    parser.set_incremental()
+    parser.parse()
+    for edit in range(5):
+        offset = source.index('g2 := g2 + 1', edit * len(source) // 6)
+        edited = source[:offset] + f'g2 := g2 + {edit + 2}' + source[offset + 12:]
+        lexer.retokenize(stream, *find_edit(source, edited))
+        source = edited
+        parser.set_tokens(stream)
+        assert str(parser.parse()) == str(parse(source))
+
+def test_arena_tree_equals_the_object_tree():
+    assert str(parse(PROGRAM, arena=NodeArena())) == str(parse(PROGRAM))
+    assert str(optimize(PROGRAM, arena=NodeArena())) == str(optimize(PROGRAM))
+
+def test_loaded_tree_is_optimized_as_the_parsed_one():
+    source = ('PROGRAM Chain; TYPE T = integer; VAR a: T; b, c: integer; '
+              'begin a := 1; b := a; c := b; end.')
+    trees = list()
+    for copy in (False, True):
+        semantic_module = SemanticModule()
+        parser = Parser(source=source)
+        parser.set_semantic_module(semantic_module)
+        tree = parser.parse()
+        if copy:
+            tree = loads(dumps(tree))
+        optimizer = NotUsedVariableOptimize(semantic_module=semantic_module)
+        trees.append(str(optimizer.process_optimization(tree)))
+    assert trees[0] == trees[1]
+    assert 'identifier: b' not in trees[0]
+
+def test_shared_expressions_keep_the_tree():
+    assert str(parse(PROGRAM, factory=NodeFactory())) == str(parse(PROGRAM))
+
+def test_loaded_tree_equals_the_saved_one():
+    tree = parse(PROGRAM)
+    data = dumps(tree)
+    assert dumps(loads(data)) == data
+    assert str(loads(data)) == str(tree)
+    assert dumps(parse(PROGRAM, lazy=True)) == data
+
+def test_loaded_tree_keeps_custom_element_types():
+    tree = parse('PROGRAM Types; TYPE T = integer; A = array[1..2] of T; '
+                 'VAR x, y: array[1..3] of T; z: array[1..2] of A; begin end.')
+    data = dumps(tree)
+    loaded = loads(data)
+    assert dumps(loaded) == data
+    assert str(loaded) == str(tree)
+    declarations = loaded.global_declaration.declaration_list
+    x, y, z = declarations[2:]
+    assert x.type.type is y.type.type
+    assert (x.type.type.identifier, x.type.type.type) == ('T', PrimitiveType.INTEGER)
+    assert z.type.type.type.type == 'T'
+
+def test_identifiers_keep_their_own_spelling():
+    source = ('program Q; var g: integer; procedure outer(x: integer); '
+              'procedure inner(q: integer); begin g := q; end; '
+              'begin inner(x); end; begin G := 1; outer(g); end.')
+    semantic_module = SemanticModule()
+    parser = Parser(source = source)
+    parser.set_semantic_module(semantic_module)
+    tree = parser.parse()
+    assert 'outer.inner.q' in semantic_module.get_scope_table()
+    inner = tree.global_declaration.declaration_list[1].declaration_part.declaration_list[0]
+    assert 'identifier: q' in str(inner) and 'identifier: Q' not in str(inner)
+
+def test_deep_parentheses():
+    parse(generate_parentheses())
+
+def test_deep_nesting():
+    dump = io.StringIO()
+    parse(generate_nesting()).write_dump(dump, max_depth=100)
+    assert dump.getvalue().startswith('SupportClasses.NodeProgram')
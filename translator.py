@@ -0,0 +1,39 @@
+from lexer import Lexer, TokenStream
+from Parser import Parser
+from SemanticModule import SemanticModule, SyntaxOnlyModule
+from SemanticAnalyzer import SemanticAnalyzer
+from gen import Gen
+from other.NodeArena import NodeArena
+from other.NodeFactory import NodeFactory
+
+# Pascal source text -> C++ source text, entirely in memory.
+# An up to date token stream of the source can be passed to skip lexing,
+# subroutine bodies are parsed in `jobs` processes (see Parser.set_jobs).
+# The tree dump is streamed to the `dump` text file if one is given (see Node.write_dump),
+# the tree is kept in `arena` if one is given (see Parser.set_arena),
+# equal expressions are shared through `factory` if one is given (see Parser.set_node_factory).
+# With `check_jobs` the parser only builds the tree, it is checked afterwards by SemanticAnalyzer
+# with the subroutine bodies in `check_jobs` processes (`jobs` and `factory` are not used then)
+def translate(source : str, tokens : TokenStream = None, jobs : int = 1, dump = None,
+              arena : NodeArena = None, factory : NodeFactory = None, check_jobs : int = None) -> str:
+    parser = Parser(source=source) if tokens is None else Parser(tokens=tokens)
+    syntax_module = SyntaxOnlyModule() if check_jobs is not None else None
+    parser.set_semantic_module(syntax_module or SemanticModule())
+    parser.set_jobs(jobs)
+    parser.set_arena(arena)
+    parser.set_node_factory(factory)
+    program = parser.parse()
+    if syntax_module is not None:
+        analyzer = SemanticAnalyzer()
+        analyzer.set_jobs(check_jobs)
+        analyzer.analyze(program, syntax_module)
+        if arena is not None:
+            program = arena.add(program)
+    if dump is not None:
+        program.write_dump(dump)
+    return Gen(program).code
+
+if __name__ == '__main__':
+    import sys
+    with open(sys.argv[1], 'r') as file:
+        print(translate(file.read()))